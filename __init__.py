@@ -1,15 +1,43 @@
 """
 EDI File Generator - HIPAA-compliant 837P and 837I claim EDI generation.
 Generates X12 837 files with SNIP2 validation; files stored with type and timestamp.
+The names below are imported from their modules on first access, so importing the package
+(e.g. in a freshly spawned worker) only loads what is used.
 """
-from .edi_schemas import get_loops, LOOPS_837P, LOOPS_837I
-from .edi_generator import build_edi_content
-from .edi_agent import generate_837_file
-
-__all__ = [
-    "get_loops",
-    "LOOPS_837P",
-    "LOOPS_837I",
-    "build_edi_content",
-    "generate_837_file",
-]
+import importlib
+
+# Public name -> defining module.
+_EXPORTS = {
+    "get_loops": ".edi_schemas",
+    "LOOPS_837P": ".edi_schemas",
+    "LOOPS_837I": ".edi_schemas",
+    "build_edi_content": ".edi_generator",
+    "build_edi_batch": ".edi_generator",
+    "compile_loops": ".edi_generator",
+    "validate_required_batch": ".edi_generator",
+    "ValidationIssue": ".edi_rules",
+    "Rule": ".edi_rules",
+    "RuleEngine": ".edi_rules",
+    "get_rule_engine": ".edi_rules",
+    "generate_837_file": ".edi_agent",
+    "generate_837_files": ".edi_agent",
+    "RolloverLimits": ".edi_agent",
+    "OpenInterchange": ".edi_agent",
+    "open_edi": ".edi_parser",
+    "parse_edi": ".edi_parser",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
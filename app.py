@@ -3,8 +3,12 @@ EDI File Generator - Streamlit UI
 Select claim type (837P/837I), enter segment values for each loop, then generate the EDI file.
 Run from project root: streamlit run EDI_File_Generator/app.py
 """
-import re
+import functools
+import io
 import sys
+import time
+import zipfile
+from collections import Counter
 from pathlib import Path
 
 # Ensure project root is on path so EDI_File_Generator package can be imported
@@ -14,7 +18,14 @@ if str(PROJECT_ROOT) not in sys.path:
 
 import streamlit as st
 from EDI_File_Generator import get_loops
-from EDI_File_Generator.edi_openai import build_claim_json, generate_837_via_openai
+from EDI_File_Generator.edi_bulk import csv_columns, get_job_manager
+from EDI_File_Generator.edi_generator import LoopSegmentCache, ValidationIssue, build_edi_preview
+from EDI_File_Generator.edi_agent import (
+    DEFAULT_STRATEGY,
+    GENERATION_STRATEGIES,
+    generate_837,
+    generation_stats,
+)
 
 st.set_page_config(
     page_title="EDI File Generator",
@@ -41,55 +52,64 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-def _parse_error_keys(claim_type: str, error_messages: list) -> set:
-    """
-    Parse validation error messages and return the set of UI keys for fields that are missing.
-    Errors look like: "Loop 1000A: Required NM101 (...) is missing." or "Loop 2400[1]: Required LX01 (...) is missing."
-    """
-    keys = set()
+def _error_keys(claim_type: str, errors: list) -> set:
+    """UI keys of the fields named by ValidationIssue records in errors (other errors are skipped)."""
     prefix = f"edi_{claim_type}_"
-    # Loop 2400[1]: Required LX01 (...) is missing.  (match repeatable first)
-    pattern_repeat = re.compile(r"Loop (\w+)\[(\d+)\]: Required ([A-Z0-9_]+) ")
-    # Loop 1000A: Required NM101 (...) is missing.  (el_id can be NM101, DTP01_2, etc.)
-    pattern_simple = re.compile(r"Loop (\w+): Required ([A-Z0-9_]+) ")
-    for msg in error_messages:
-        m = pattern_repeat.match(msg)
-        if m:
-            loop_id, idx, el_id = m.group(1), m.group(2), m.group(3)
-            keys.add(f"{prefix}{loop_id}_{idx}_{el_id}")
+    keys = set()
+    for issue in errors:
+        if not isinstance(issue, ValidationIssue) or not issue.element_id:
             continue
-        m = pattern_simple.match(msg)
-        if m:
-            loop_id, el_id = m.group(1), m.group(2)
-            keys.add(f"{prefix}{loop_id}_{el_id}")
+        if issue.repetition is None:
+            keys.add(f"{prefix}{issue.loop_id}_{issue.element_id}")
+        else:
+            keys.add(f"{prefix}{issue.loop_id}_{issue.repetition}_{issue.element_id}")
     return keys
 
 
+# ISA overrides offered in the Interchange expander.
+ISA_FIELDS = ("ISA06", "ISA08", "ISA13")
+
+
+@functools.lru_cache(maxsize=None)
+def _form_fields(claim_type: str) -> tuple:
+    """(loop_id, repeatable, element ids) for every loop rendered by main(), in schema order."""
+    return tuple(
+        (
+            loop_def["loop_id"],
+            bool(loop_def.get("repeatable")) and loop_def["loop_id"] == "2400",
+            tuple(el["id"] for seg in loop_def.get("segments", []) for el in seg.get("elements", [])),
+        )
+        for loop_def in get_loops(claim_type)
+    )
+
+
+def _text_values(prefix: str, el_ids: tuple) -> dict:
+    """{el_id: value} for the text inputs keyed prefix + el_id that exist in session_state."""
+    values = {}
+    for el_id in el_ids:
+        value = st.session_state.get(prefix + el_id)
+        if isinstance(value, str):
+            values[el_id] = value
+    return values
+
+
 def _collect_form_data(claim_type: str) -> dict:
-    """Build form_data from session_state keys prefixed with edi_{claim_type}_."""
-    form_data = {}
+    """Build form_data from the session_state keys of the fields main() renders (edi_{claim_type}_...)."""
     prefix = f"edi_{claim_type}_"
-    for key, value in list(st.session_state.items()):
-        if not key.startswith(prefix) or not isinstance(value, str):
-            continue
-        if "_2400_count" in key:
-            continue
-        rest = key[len(prefix):]
-        parts = rest.split("_")
-        if len(parts) >= 2 and parts[0] == "2400" and parts[1].isdigit():
-            idx = int(parts[1])
-            el_id = "_".join(parts[2:]) if len(parts) > 2 else parts[1]
-            if "2400" not in form_data:
-                form_data["2400"] = []
-            while len(form_data["2400"]) <= idx:
-                form_data["2400"].append({})
-            form_data["2400"][idx][el_id] = value
-        elif len(parts) >= 2:
-            loop_id = parts[0]
-            el_id = "_".join(parts[1:])
-            if loop_id not in form_data:
-                form_data[loop_id] = {}
-            form_data[loop_id][el_id] = value
+    form_data = {}
+    isa = _text_values(f"{prefix}ISA_", ISA_FIELDS)
+    if isa:
+        form_data["ISA"] = isa
+    for loop_id, repeatable, el_ids in _form_fields(claim_type):
+        if repeatable:
+            n_lines = int(st.session_state.get(f"{prefix}2400_count", 1))
+            lines = [_text_values(f"{prefix}2400_{i}_", el_ids) for i in range(n_lines)]
+            if any(lines):
+                form_data[loop_id] = lines
+        else:
+            values = _text_values(f"{prefix}{loop_id}_", el_ids)
+            if values:
+                form_data[loop_id] = values
     form_data["_ISA"] = form_data.get("ISA", form_data.get("_ISA", {}))
     return form_data
 
@@ -119,6 +139,152 @@ def _render_field_with_error(claim_type: str, loop_id: str, el: dict, key: str,
         )
 
 
+STRATEGY_LABELS = {
+    "local": "Local generator only",
+    "local_first": "Local first, OpenAI if validation fails",
+    "llm": "OpenAI only",
+}
+
+
+def _render_strategy_stats():
+    """Sidebar: per-strategy call counts and latency for this server process."""
+    with st.sidebar.expander("Generation stats", expanded=False):
+        for strategy, stats in generation_stats().items():
+            if not stats["calls"]:
+                continue
+            avg_ms = stats["seconds"] / stats["calls"] * 1000
+            st.caption(
+                f"**{STRATEGY_LABELS[strategy]}**: {stats['calls']} call(s), avg {avg_ms:.1f} ms, "
+                f"max {stats['max_seconds'] * 1000:.1f} ms, OpenAI calls {stats['llm_calls']}, "
+                f"avoided {stats['llm_avoided']}"
+            )
+
+
+# Minimum seconds between redraws of the streamed EDI preview.
+STREAM_PREVIEW_INTERVAL = 0.1
+
+
+def _stream_preview():
+    """on_segment callback that shows streamed OpenAI segments (one per line) in a placeholder."""
+    placeholder = st.empty()
+    segments = []
+    last_draw = 0.0
+
+    def on_segment(segment: str):
+        nonlocal last_draw
+        segments.append(segment)
+        now = time.monotonic()
+        if now - last_draw >= STREAM_PREVIEW_INTERVAL:
+            placeholder.code("\n".join(segments), language=None)
+            last_draw = now
+
+    def finish():
+        placeholder.empty()
+
+    return on_segment, finish
+
+
+def _render_live_preview(claim_type: str):
+    """Sidebar: the claim's EDI as currently entered, re-encoding only loops whose fields changed."""
+    cache = st.session_state.get("_edi_preview_cache")
+    if cache is None:
+        cache = st.session_state["_edi_preview_cache"] = LoopSegmentCache()
+    start = time.perf_counter()
+    edi, errors = build_edi_preview(claim_type, _collect_form_data(claim_type), get_loops(claim_type), cache)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    with st.sidebar:
+        st.markdown("**Live EDI preview**")
+        st.caption(
+            f"{elapsed_ms:.1f} ms · {len(errors)} validation issue(s) · "
+            "control numbers are assigned when the file is created"
+        )
+        st.code(edi.replace("~", "~\n"), language=None)
+
+
+# Seconds between refreshes of the bulk job status panel.
+BULK_REFRESH_SECONDS = 1.0
+
+
+def _bulk_result_payload(job) -> tuple | None:
+    """(data, file_name, mime) for a finished job: the .edi file itself, or a zip when it rolled over."""
+    paths = [Path(p) for p in job.summary["files"] if Path(p).exists()]
+    if not paths:
+        return None
+    if len(paths) == 1:
+        return paths[0].read_bytes(), paths[0].name, "application/octet-stream"
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for path in paths:
+            zf.write(path, path.name)
+    return buf.getvalue(), f"{job.claim_type}_batch_{job.id}.zip", "application/zip"
+
+
+def _bulk_result_download(job):
+    # Built once per job and session, not on every refresh of the status panel.
+    key = f"edi_bulk_payload_{job.id}"
+    if key not in st.session_state:
+        st.session_state[key] = _bulk_result_payload(job)
+    payload = st.session_state[key]
+    if payload is not None:
+        data, file_name, mime = payload
+        st.download_button("Download result", data, file_name=file_name, mime=mime, key=f"edi_bulk_download_{job.id}")
+
+
+@st.fragment(run_every=BULK_REFRESH_SECONDS)
+def _render_bulk_jobs():
+    """This session's bulk jobs; refreshes on its own while the rest of the page stays idle."""
+    manager = get_job_manager()
+    job_ids = st.session_state.get("edi_bulk_job_ids", [])
+    jobs = [job for job in map(manager.get, job_ids) if job is not None]
+    if not jobs:
+        st.caption("No bulk jobs yet.")
+        return
+    for job in reversed(jobs):
+        st.markdown(f"**{job.name or job.id}** – {job.claim_type}, {job.status}")
+        if job.status in ("queued", "running"):
+            total = f"{job.total:,}" if job.total is not None else "?"
+            st.progress(job.progress, text=f"{job.claims_done:,} / {total} claims · {job.claims_per_sec:,.0f} claims/sec")
+        elif job.status == "failed":
+            st.error(job.error)
+        else:
+            summary = job.summary
+            st.success(
+                f"{summary['claims']:,} claims in {summary['transaction_sets']} transaction set(s), "
+                f"{len(summary['files'])} file(s), {summary['seconds']:.1f}s ({job.claims_per_sec:,.0f} claims/sec)"
+            )
+            if summary["errors"]:
+                with st.expander(f"{len(summary['errors'])} validation warning(s)"):
+                    counts = Counter((e.loop_id, e.element_id or "(loop)") for e in summary["errors"])
+                    st.dataframe(
+                        [{"Loop": loop_id, "Element": el_id, "Count": n} for (loop_id, el_id), n in counts.most_common()],
+                        hide_index=True,
+                    )
+                    st.text("\n".join(map(str, summary["errors"][:200])))
+            _bulk_result_download(job)
+
+
+def _render_bulk_upload(claim_type: str):
+    """Upload a CSV or JSONL of claims and generate them in the background (server-wide worker pool)."""
+    st.markdown("**Upload claims** (CSV or JSONL, one claim per row/line)")
+    st.caption(
+        "CSV columns are `<loop>_<element>` (e.g. `2300_CLM01`), `2400_<n>_<element>` for service line n "
+        "(from 0) and `ISA_ISA06` / `ISA_ISA08` / `ISA_ISA13`. JSONL lines are form_data objects."
+    )
+    st.download_button(
+        "Download CSV template",
+        ",".join(csv_columns(claim_type)) + "\n",
+        file_name=f"{claim_type}_template.csv",
+        mime="text/csv",
+        key=f"edi_bulk_template_{claim_type}",
+    )
+    upload = st.file_uploader("Claims file", type=["csv", "jsonl"], key=f"edi_bulk_upload_{claim_type}")
+    if upload is not None and st.button("**Generate batch**", type="primary", key=f"edi_bulk_submit_{claim_type}"):
+        fmt = "csv" if upload.name.lower().endswith(".csv") else "jsonl"
+        job = get_job_manager().submit(claim_type, upload.getvalue(), fmt, upload.name)
+        st.session_state.setdefault("edi_bulk_job_ids", []).append(job.id)
+    _render_bulk_jobs()
+
+
 def main():
     st.markdown("""
     <div class="main-header">
@@ -142,6 +308,15 @@ def main():
         st.error(str(e))
         return
 
+    single_tab, bulk_tab = st.tabs(["Single claim", "Bulk upload"])
+    with bulk_tab:
+        _render_bulk_upload(claim_type)
+    with single_tab:
+        _render_single_claim(claim_type, loops)
+
+
+def _render_single_claim(claim_type: str, loops: list):
+    """Interchange overrides, per-loop fields and the Create EDI file button for one claim."""
     # Show validation error banner when fields are highlighted in red (after rerun)
     all_error_keys = st.session_state.get("edi_error_keys", set())
     error_keys = {k for k in all_error_keys if k.startswith(f"edi_{claim_type}_")}
@@ -158,6 +333,8 @@ def main():
             st.text_input("ISA Control Number (ISA13)", key=f"edi_{claim_type}_ISA_ISA13", placeholder="Auto-generated")
         st.caption("Other ISA elements use standard 5010 defaults.")
 
+    _render_live_preview(claim_type)
+
     # 2. For each loop: allow user to enter segment values
     st.markdown("---")
     st.markdown("**2. Enter segment values for each loop**")
@@ -193,19 +370,29 @@ def main():
                         key = f"edi_{claim_type}_{loop_id}_{el['id']}"
                         _render_field_with_error(claim_type, loop_id, el, key)
 
-    # 3. Generate EDI file from user inputs (JSON template → OpenAI → save EDI)
+    # 3. Generate EDI file from user inputs (local generator and/or JSON template → OpenAI → save EDI)
     st.markdown("---")
+    strategy = st.radio(
+        "**3. Generation strategy**",
+        GENERATION_STRATEGIES,
+        index=GENERATION_STRATEGIES.index(DEFAULT_STRATEGY) if DEFAULT_STRATEGY in GENERATION_STRATEGIES else 1,
+        format_func=STRATEGY_LABELS.get,
+        key="edi_generation_strategy",
+        horizontal=True,
+    )
     if st.button("**Create EDI file**", type="primary", use_container_width=True):
         form_data = _collect_form_data(claim_type)
-        claim_json = build_claim_json(form_data, claim_type)
-        with st.spinner("Building JSON and calling OpenAI to generate EDI..."):
-            result = generate_837_via_openai(claim_type, claim_json)
+        spinner = "Generating EDI..." if strategy != "llm" else "Building JSON and calling OpenAI to generate EDI..."
+        on_segment, finish_preview = _stream_preview()
+        with st.spinner(spinner):
+            result = generate_837(claim_type, form_data, strategy, on_segment=on_segment)
+        finish_preview()
         if result["success"]:
             st.session_state.pop("edi_error_keys", None)
             st.success(result["message"])
             if result.get("errors"):
                 for err in result["errors"]:
-                    st.warning(err)
+                    st.warning(str(err))
             file_path = result.get("file_path")
             file_name = result.get("file_name")
             if file_path and Path(file_path).exists():
@@ -220,13 +407,14 @@ def main():
                 )
         else:
             errors = result.get("errors", [])
-            st.session_state["edi_error_keys"] = _parse_error_keys(claim_type, errors)
+            st.session_state["edi_error_keys"] = _error_keys(claim_type, errors)
             st.error(result["message"])
             for err in errors:
-                st.warning(err)
+                st.warning(str(err))
             if st.session_state.get("edi_error_keys"):
                 st.rerun()
 
 
 if __name__ == "__main__":
     main()
+    _render_strategy_stats()
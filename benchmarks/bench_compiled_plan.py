@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-claim cost of the compiled schema plan vs. walking the raw loop dicts.
+Usage (from project root Gen-AI-Dev-Course):
+  python EDI_File_Generator/benchmarks/bench_compiled_plan.py
+  python EDI_File_Generator/benchmarks/bench_compiled_plan.py 837I 100000
+"""
+import sys
+import time
+from pathlib import Path
+
+_project_root = Path(__file__).resolve().parent.parent.parent
+if str(_project_root) not in sys.path:
+    sys.path.insert(0, str(_project_root))
+
+from EDI_File_Generator import get_loops
+from EDI_File_Generator.edi_generator import (
+    ELEMENT_SEPARATOR,
+    SEGMENT_TERMINATOR,
+    _REQUIRED_LOOPS,
+    _claim_segments,
+    _format_date,
+    _sanitize,
+    _validate_required,
+    get_encoder,
+)
+from EDI_File_Generator.run_edi_generator import sample_837i_data, sample_837p_data
+
+
+def _build_segment(seg_id: str, elements: list[str]) -> str:
+    """Reference: per-segment string building before X12Encoder."""
+    parts = [seg_id]
+    for el in elements:
+        parts.append(_sanitize(el))
+    return ELEMENT_SEPARATOR.join(parts) + SEGMENT_TERMINATOR
+
+
+def _compiled_claim_segments(form_data: dict, loops_schema: list, errors: list) -> list[bytes]:
+    return list(_claim_segments(form_data, loops_schema, errors, get_encoder()))
+
+
+def _legacy_validate(loop_data: dict, loops_schema: list) -> list[str]:
+    """Reference: the schema walk _validate_required did before compile_loops."""
+    errors = []
+    for loop_def in loops_schema:
+        loop_id = loop_def["loop_id"]
+        loop_values = loop_data.get(loop_id, {})
+        if isinstance(loop_values, list):
+            for i, item in enumerate(loop_values):
+                for seg in loop_def.get("segments", []):
+                    for el in seg.get("elements", []):
+                        if el.get("required"):
+                            key = el["id"] if i == 0 else f"{el['id']}_{i}"
+                            val = item.get(el["id"], item.get(key, ""))
+                            if not _sanitize(val):
+                                errors.append(f"Loop {loop_id}[{i}]: Required {el['id']} ({el['label']}) is missing.")
+        else:
+            for seg in loop_def.get("segments", []):
+                for el in seg.get("elements", []):
+                    if el.get("required"):
+                        val = loop_values.get(el["id"], "")
+                        if not _sanitize(val):
+                            errors.append(f"Loop {loop_id}: Required {el['id']} ({el['label']}) is missing.")
+    return errors
+
+
+def _legacy_claim_segments(form_data: dict, loops_schema: list, errors: list) -> list[str]:
+    """Reference: the schema walk build_edi_content did before compile_loops."""
+    segments_out = []
+    for loop_def in loops_schema:
+        loop_id = loop_def["loop_id"]
+        repeatable = loop_def.get("repeatable", False)
+        loop_values = form_data.get(loop_id)
+        if loop_values is None:
+            if loop_id in _REQUIRED_LOOPS:
+                errors.append(f"Loop {loop_id} is required.")
+            continue
+        items = loop_values if (repeatable and isinstance(loop_values, list)) else ([loop_values] if loop_values else [])
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            for seg_def in loop_def.get("segments", []):
+                elements = []
+                for el_def in seg_def.get("elements", []):
+                    el_id = el_def["id"]
+                    val = item.get(el_id, "")
+                    if "03" in el_id and "DTP" in el_id:
+                        val = _format_date(val)
+                    elements.append(val)
+                if any(_sanitize(e) for e in elements):
+                    segments_out.append(_build_segment(seg_def["seg_id"], elements))
+    return segments_out
+
+
+def _run(label: str, validate, build, claims: list, loops: list) -> float:
+    start = time.perf_counter()
+    for form_data in claims:
+        errors = validate(form_data, loops)
+        list(build(form_data, loops, errors))
+    elapsed = time.perf_counter() - start
+    print(f"{label:>9}: {elapsed:.3f}s total, {elapsed / len(claims) * 1e6:.2f} us/claim")
+    return elapsed
+
+
+def main():
+    claim_type = sys.argv[1].upper() if len(sys.argv) > 1 else "837P"
+    n_claims = int(sys.argv[2]) if len(sys.argv) > 2 else 100_000
+    sample = sample_837i_data if claim_type == "837I" else sample_837p_data
+    claims = [sample() for _ in range(n_claims)]
+    loops = get_loops(claim_type)
+
+    print(f"{claim_type}, {n_claims} claims (validate + build loop segments)")
+    legacy = _run("legacy", _legacy_validate, _legacy_claim_segments, claims, loops)
+    compiled = _run("compiled", _validate_required, _compiled_claim_segments, claims, loops)
+    print(f"  speedup: {legacy / compiled:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
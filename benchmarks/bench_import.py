@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Import-time check: imports the package and its worker-facing modules in fresh interpreters under
+`python -X importtime`, reports the cumulative import time of each (best of --repeat) with the
+slowest dependencies, and fails (exit status 1) when one goes over its budget, pulls in a module
+that should only load on first use (openai, dotenv, http.server, the profilers, sqlite3), or
+touches the filesystem (the output, cache and control-number paths are pointed at a temporary
+directory that must still be empty afterwards).
+
+Budgets are multiples of the interpreter's own startup time (wall clock of `python -c pass`,
+best of --repeat, measured alternately with each module), so they hold on slower or busier
+machines: package 1x, edi_generator 4x, edi_agent 5x, edi_bulk 9x, edi_parser 3x,
+edi_openai 10x (asyncio). Measured at about 0.05x, 1.9x, 2.6x, 4.6x, 1.3x and 4.8x.
+
+Usage (from project root Gen-AI-Dev-Course):
+  python EDI_File_Generator/benchmarks/bench_import.py
+  python EDI_File_Generator/benchmarks/bench_import.py --repeat 10 --top 5 --json imports.json
+  python EDI_File_Generator/benchmarks/bench_import.py --scale 2        # double every budget
+  python EDI_File_Generator/benchmarks/bench_import.py --no-budgets     # report times, check side effects only
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+_project_root = Path(__file__).resolve().parent.parent.parent
+
+PACKAGE = "EDI_File_Generator"
+# Cumulative import time budgets, in multiples of the `python -c pass` startup time.
+BUDGETS = {
+    PACKAGE: 1,
+    f"{PACKAGE}.edi_generator": 4,
+    f"{PACKAGE}.edi_agent": 5,
+    f"{PACKAGE}.edi_bulk": 9,
+    f"{PACKAGE}.edi_parser": 3,
+    f"{PACKAGE}.edi_openai": 10,
+}
+# Loaded on first use only; importing any module above must not pull these in.
+DEFERRED = ("openai", "dotenv", "http.server", "cProfile", "pstats", "tracemalloc", "sqlite3", "streamlit")
+
+_PROBE = "import {module}; import json, sys; print(json.dumps(sorted(sys.modules)))"
+
+
+def _parse_importtime(stderr: str, module: str) -> dict[str, tuple[int, int]]:
+    """{name: (self_us, cumulative_us)} of module and everything it imported, from -X importtime output."""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        if not self_us.strip().isdigit():
+            continue
+        # Children are listed before their parent, one level deeper; a top-level line closes a tree.
+        top_level = not name[1:].startswith(" ")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+        if top_level:
+            if name.strip() == module:
+                return times
+            times = {}
+    raise ValueError(f"{module} not found in -X importtime output")
+
+
+def _env(scratch: Path) -> dict:
+    return dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(filter(None, (str(_project_root), os.getenv("PYTHONPATH")))),
+        PYTHONDONTWRITEBYTECODE="1",
+        EDI_OUTPUT_DIR=str(scratch / "output"),
+        EDI_CONTROL_NUMBERS_DB=str(scratch / "control" / "numbers.sqlite3"),
+        EDI_OPENAI_CACHE_DIR=str(scratch / "cache"),
+        EDI_METRICS_FILE=str(scratch / "metrics.prom"),
+    )
+
+
+def baseline_ms(scratch: Path) -> float:
+    """Wall-clock time of `python -c pass` (interpreter startup and shutdown), in ms."""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], env=_env(scratch), cwd=scratch, check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def measure(module: str, scratch: Path) -> dict:
+    """Import module once in a fresh interpreter; returns its timings and loaded modules."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module)],
+        env=_env(scratch), cwd=scratch, capture_output=True, text=True, check=True,
+    )
+    times = _parse_importtime(proc.stderr, module)
+    return {
+        "cumulative_us": times[module][1],
+        "times": times,
+        "modules": json.loads(proc.stdout),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time and side effects of the package modules.")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per module (best is kept)")
+    parser.add_argument("--top", type=int, default=8, help="Slowest dependencies listed per module")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every budget")
+    parser.add_argument("--no-budgets", action="store_true", help="Report import times without failing on them")
+    parser.add_argument("--json", metavar="PATH", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    failures = []
+    for module, budget in BUDGETS.items():
+        with tempfile.TemporaryDirectory(prefix="edi_import_") as scratch:
+            scratch = Path(scratch)
+            runs = []
+            baselines = []
+            for _ in range(args.repeat):
+                baselines.append(baseline_ms(scratch))
+                runs.append(measure(module, scratch))
+            leftovers = sorted(str(p.relative_to(scratch)) for p in scratch.rglob("*"))
+        best = min(runs, key=lambda run: run["cumulative_us"])
+        ms = best["cumulative_us"] / 1000
+        startup_ms = min(baselines)
+        budget_ms = budget * args.scale * startup_ms
+        deferred = [name for name in DEFERRED if name in best["modules"]]
+        slowest = sorted(
+            ((name, cumulative) for name, (_, cumulative) in best["times"].items() if name != module),
+            key=lambda item: -item[1],
+        )[:args.top]
+        results[module] = {
+            "ms": ms, "startup_ms": startup_ms, "budget_ms": budget_ms,
+            "deferred_loaded": deferred, "files_created": leftovers,
+            "slowest": {name: cumulative / 1000 for name, cumulative in slowest},
+        }
+
+        status = "ok"
+        if ms > budget_ms:
+            status = "OVER BUDGET"
+            if not args.no_budgets:
+                failures.append(f"{module}: {ms:.1f} ms > {budget_ms:.1f} ms budget ({budget:g}x startup {startup_ms:.1f} ms)")
+        if deferred:
+            failures.append(f"{module}: imports {', '.join(deferred)} at import time")
+            status = "EAGER IMPORT"
+        if leftovers:
+            failures.append(f"{module}: created {', '.join(leftovers)} at import time")
+            status = "FILESYSTEM"
+        print(f"{module:<32} {ms:8.1f} ms = {ms / startup_ms:4.2f}x startup {startup_ms:.1f} ms "
+              f"(budget {budget * args.scale:g}x)  {status}")
+        for name, cumulative in slowest:
+            print(f"    {name:<40} {cumulative / 1000:8.1f} ms")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    for failure in failures:
+        print("FAIL:", failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark: serial generate_837_via_openai vs. generate_837_batch_via_openai_async.
+Point OPENAI_BASE_URL at benchmarks/stub_openai_server.py (or a real endpoint) first.
+The response cache is bypassed (the claims are identical), so every claim is a real request.
+Usage (from project root Gen-AI-Dev-Course):
+  OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub \\
+    python EDI_File_Generator/benchmarks/bench_openai_async.py --claims 200 --concurrency 32
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+_project_root = Path(__file__).resolve().parent.parent.parent
+if str(_project_root) not in sys.path:
+    sys.path.insert(0, str(_project_root))
+
+from EDI_File_Generator.edi_openai import (
+    build_claim_json,
+    generate_837_batch_via_openai_async,
+    generate_837_via_openai,
+)
+from EDI_File_Generator.run_edi_generator import sample_837i_data, sample_837p_data
+
+
+async def _run_async(claim_type: str, claim_jsons: list, concurrency: int, rps: float | None) -> list:
+    results = []
+    async for index, result in generate_837_batch_via_openai_async(
+        claim_type, claim_jsons, concurrency, rps, use_cache=False
+    ):
+        results.append((index, result))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI path throughput: serial vs. async.")
+    parser.add_argument("--claim-type", default="837P", type=str.upper, choices=("837P", "837I"))
+    parser.add_argument("--claims", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rps", type=float, default=None, help="Optional requests/sec limit for the async run")
+    parser.add_argument("--serial", type=int, default=10, help="Claims to send serially for comparison (0 to skip)")
+    args = parser.parse_args()
+
+    sample = sample_837i_data if args.claim_type == "837I" else sample_837p_data
+    claim_jsons = [build_claim_json(sample(), args.claim_type) for _ in range(args.claims)]
+
+    if args.serial:
+        start = time.perf_counter()
+        ok = sum(generate_837_via_openai(args.claim_type, cj, use_cache=False)["success"] for cj in claim_jsons[:args.serial])
+        seconds = time.perf_counter() - start
+        print(f"serial: {args.serial} claims ({ok} ok) in {seconds:.2f}s, {args.serial / seconds:.1f} claims/sec")
+
+    start = time.perf_counter()
+    results = asyncio.run(_run_async(args.claim_type, claim_jsons, args.concurrency, args.rps))
+    seconds = time.perf_counter() - start
+    ok = sum(r["success"] for _, r in results)
+    print(f"async:  {len(results)} claims ({ok} ok) in {seconds:.2f}s, {len(results) / seconds:.1f} claims/sec "
+          f"(concurrency {args.concurrency})")
+    failed = next((r for _, r in results if not r["success"]), None)
+    if failed:
+        print("  first error:", failed["message"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Load test for edi_service: keeps --connections keep-alive connections busy with POSTs of the
+sample claim and reports requests/sec and latency percentiles, then checks them against the
+targets (exit status 1 when missed). Starts the service in a subprocess unless --url is given.
+
+Target (4 workers, 64 connections, single-line 837P, ?output=edi, 2 ms batch window):
+  >= 2,000 requests/sec with p99 latency <= 100 ms on a 4-core machine.
+
+Usage (from project root Gen-AI-Dev-Course):
+  python EDI_File_Generator/benchmarks/bench_service.py
+  python EDI_File_Generator/benchmarks/bench_service.py --requests 50000 --connections 128 --workers 8
+  python EDI_File_Generator/benchmarks/bench_service.py --batch-ms 0          # no coalescing, for comparison
+  python EDI_File_Generator/benchmarks/bench_service.py --url http://127.0.0.1:8837 --output file
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+from urllib.parse import urlsplit
+
+_project_root = Path(__file__).resolve().parent.parent.parent
+if str(_project_root) not in sys.path:
+    sys.path.insert(0, str(_project_root))
+
+from EDI_File_Generator.run_edi_generator import sample_837i_data, sample_837p_data
+
+TARGET_RPS = 2000
+TARGET_P99_MS = 100
+
+
+async def _worker(host: str, port: int, request: bytes, remaining: list, latencies: list, failures: list):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            start = time.perf_counter()
+            writer.write(request)
+            head = await reader.readuntil(b"\r\n\r\n")
+            status = int(head.split(b" ", 2)[1])
+            length = next(
+                int(line.split(b":", 1)[1]) for line in head.split(b"\r\n") if line.lower().startswith(b"content-length:")
+            )
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                failures.append(status)
+    finally:
+        writer.close()
+
+
+async def run_load(url: str, claim_type: str, output: str, n_requests: int, connections: int) -> dict:
+    parts = urlsplit(url)
+    sample = sample_837i_data() if claim_type == "837I" else sample_837p_data()
+    body = json.dumps(sample).encode("utf-8")
+    request = (
+        f"POST /v1/claims/{claim_type}?output={output} HTTP/1.1\r\n"
+        f"Host: {parts.netloc}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+    ).encode("latin-1") + body
+    remaining = [n_requests]
+    latencies = []
+    failures = []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _worker(parts.hostname, parts.port, request, remaining, latencies, failures) for _ in range(connections)
+    ))
+    seconds = time.perf_counter() - start
+    latencies.sort()
+
+    def pct(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000
+
+    return {
+        "requests": len(latencies),
+        "failures": len(failures),
+        "seconds": seconds,
+        "rps": len(latencies) / seconds,
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+        "max_ms": latencies[-1] * 1000,
+    }
+
+
+def _wait_ready(url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(url + "/healthz", timeout=1) as response:
+                return json.load(response)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput/latency of the EDI generation service.")
+    parser.add_argument("--url", default=None, help="Running service (default: start one on --port)")
+    parser.add_argument("--port", type=int, default=8838)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-ms", type=float, default=2.0)
+    parser.add_argument("--claim-type", default="837P", type=str.upper, choices=("837P", "837I"))
+    parser.add_argument("--output", default="edi", choices=("edi", "file"))
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--connections", type=int, default=64)
+    parser.add_argument("--warmup", type=int, default=1_000, help="Requests sent (and not measured) first")
+    parser.add_argument("--target-rps", type=float, default=TARGET_RPS)
+    parser.add_argument("--target-p99-ms", type=float, default=TARGET_P99_MS)
+    parser.add_argument("--json", metavar="PATH", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        url = f"http://127.0.0.1:{args.port}"
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (str(_project_root), os.getenv("PYTHONPATH")))))
+        server = subprocess.Popen(
+            [sys.executable, "-m", "EDI_File_Generator.edi_service", "--port", str(args.port),
+             "--workers", str(args.workers), "--batch-ms", str(args.batch_ms)],
+            env=env,
+        )
+    try:
+        health = _wait_ready(url)
+        if args.warmup:
+            asyncio.run(run_load(url, args.claim_type, args.output, args.warmup, args.connections))
+        result = asyncio.run(run_load(url, args.claim_type, args.output, args.requests, args.connections))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    result.update(workers=health["workers"], connections=args.connections, batch_ms=args.batch_ms, output=args.output)
+    print(f"{result['requests']} requests ({result['failures']} failed) in {result['seconds']:.2f}s: "
+          f"{result['rps']:.0f} req/s, p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms, "
+          f"p99 {result['p99_ms']:.1f} ms, max {result['max_ms']:.1f} ms "
+          f"({result['workers']} workers, {args.connections} connections, batch window {args.batch_ms:g} ms)")
+    if args.json:
+        Path(args.json).write_text(json.dumps(result, indent=2), encoding="utf-8")
+
+    met = result["failures"] == 0 and result["rps"] >= args.target_rps and result["p99_ms"] <= args.target_p99_ms
+    print(f"Target ({args.target_rps:g} req/s, p99 <= {args.target_p99_ms:g} ms): {'met' if met else 'MISSED'}")
+    sys.exit(0 if met else 1)
+
+
+if __name__ == "__main__":
+    main()
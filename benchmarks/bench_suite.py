@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the validation, generation, SE-recount and file-write paths.
+Scales the run_edi_generator samples up to fixed corpora (claims x service lines per claim)
+and reports claims/sec, segments/sec, peak RSS and allocations for each stage separately.
+Each (stage, corpus) case runs in a fresh worker process so peak RSS is per case.
+
+Usage (from project root Gen-AI-Dev-Course):
+  python EDI_File_Generator/benchmarks/bench_suite.py
+  python EDI_File_Generator/benchmarks/bench_suite.py --claims 1,1000 --lines 1,50 --json results.json
+  python EDI_File_Generator/benchmarks/bench_suite.py --stages build,write --claim-type 837I
+
+Stages:
+  validate  _validate_required per claim
+  build     build_edi_content per claim
+  norules   build_edi_content per claim with the edi_rules engine off (build - norules = rule cost)
+  recount   recount_se_and_fix per claim (EDI built beforehand, not timed)
+  parse     edi_parser.parse_edi per claim (EDI built beforehand, not timed)
+  write     generate_837_file per claim (files go to a temporary directory)
+"""
+import argparse
+import json
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+
+_project_root = Path(__file__).resolve().parent.parent.parent
+if str(_project_root) not in sys.path:
+    sys.path.insert(0, str(_project_root))
+
+from EDI_File_Generator import build_edi_content, generate_837_file, get_loops
+from EDI_File_Generator.edi_sink import FileSink, set_output_sink
+from EDI_File_Generator.edi_generator import SEGMENT_TERMINATOR, _validate_required, recount_se_and_fix
+from EDI_File_Generator.edi_parser import parse_edi
+from EDI_File_Generator.edi_rules import set_rule_engine
+from EDI_File_Generator.run_edi_generator import sample_837i_data, sample_837p_data
+
+STAGES = ("validate", "build", "norules", "recount", "parse", "write")
+DEFAULT_CLAIMS = (1, 1_000, 100_000)
+DEFAULT_LINES = (1, 50, 1_000)
+# Allocations are traced (tracemalloc) over a separate run on at most this many claims.
+ALLOC_SAMPLE = 100
+
+
+def make_corpus(claim_type: str, n_claims: int, n_lines: int) -> list[dict]:
+    """
+    n_claims copies of the sample claim, each with n_lines service lines, a unique CLM01 and CLM02
+    set to the line total (so claim_balance passes). Claims share their 2400 line dicts (read-only
+    for every stage) to keep corpus memory small.
+    """
+    base = sample_837i_data() if claim_type == "837I" else sample_837p_data()
+    template = base["2400"][0]
+    lines = [{**template, "LX01": str(k + 1)} for k in range(n_lines)]
+    charge = Decimal(template["SV202" if claim_type == "837I" else "SV103"]) * n_lines
+    corpus = []
+    for i in range(n_claims):
+        claim = dict(base)
+        claim["2300"] = {**base["2300"], "CLM01": f"CLM{i:09d}", "CLM02": f"{charge:.2f}"}
+        claim["2400"] = lines
+        claim["_ISA"] = {}
+        corpus.append(claim)
+    return corpus
+
+
+def _stage_runner(stage: str, claim_type: str, corpus: list[dict], out_dir: str):
+    """Return (run, inputs): run(inputs) executes stage once over the prepared inputs."""
+    loops = get_loops(claim_type)
+    if stage == "validate":
+        return lambda claims: [_validate_required(c, loops) for c in claims], corpus
+    if stage == "build":
+        return lambda claims: [build_edi_content(claim_type, c, loops) for c in claims], corpus
+    if stage == "norules":
+        set_rule_engine(None)
+        return lambda claims: [build_edi_content(claim_type, c, loops) for c in claims], corpus
+    if stage == "recount":
+        edis = [build_edi_content(claim_type, c, loops)[0] for c in corpus]
+        return lambda items: [recount_se_and_fix(e) for e in items], edis
+    if stage == "parse":
+        edis = [build_edi_content(claim_type, c, loops)[0].encode("utf-8") for c in corpus]
+        return lambda items: [parse_edi(e) for e in items], edis
+    if stage == "write":
+        set_output_sink(FileSink(out_dir))
+        return lambda claims: [generate_837_file(claim_type, c) for c in claims], corpus
+    raise ValueError(f"Unknown stage: {stage}")
+
+
+def run_case(stage: str, claim_type: str, n_claims: int, n_lines: int) -> dict:
+    """Worker: build the corpus, time one stage over it and measure memory."""
+    corpus = make_corpus(claim_type, n_claims, n_lines)
+    edi, _ = build_edi_content(claim_type, corpus[0], get_loops(claim_type))
+    segments_per_claim = edi.count(SEGMENT_TERMINATOR)
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        run, inputs = _stage_runner(stage, claim_type, corpus, out_dir)
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        run(inputs)
+        seconds = time.perf_counter() - start
+        rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        sample = inputs[:ALLOC_SAMPLE]
+        tracemalloc.start()
+        run(sample)
+        alloc_current, alloc_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    rss_unit = 1 if sys.platform == "darwin" else 1024
+    return {
+        "stage": stage,
+        "claim_type": claim_type,
+        "claims": n_claims,
+        "service_lines": n_lines,
+        "seconds": seconds,
+        "claims_per_sec": n_claims / seconds if seconds else None,
+        "segments_per_sec": n_claims * segments_per_claim / seconds if seconds else None,
+        "segments_per_claim": segments_per_claim,
+        "peak_rss_bytes": rss_peak * rss_unit,
+        "peak_rss_growth_bytes": (rss_peak - rss_before) * rss_unit,
+        "alloc_sample_claims": len(sample),
+        "alloc_peak_bytes": alloc_peak,
+        "alloc_retained_bytes": alloc_current,
+    }
+
+
+def _int_list(text: str) -> list[int]:
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EDI generator benchmark suite.")
+    parser.add_argument("--claim-type", default="837P", type=str.upper, choices=("837P", "837I"))
+    parser.add_argument("--claims", type=_int_list, default=list(DEFAULT_CLAIMS), help="Comma-separated claim counts")
+    parser.add_argument("--lines", type=_int_list, default=list(DEFAULT_LINES), help="Comma-separated service lines per claim")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma-separated subset of {','.join(STAGES)}")
+    parser.add_argument("--max-total-lines", type=int, default=5_000_000,
+                        help="Skip corpora with more than this many service lines in total")
+    parser.add_argument("--json", metavar="PATH", help="Write machine-readable results to PATH")
+    args = parser.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    for stage in stages:
+        if stage not in STAGES:
+            parser.error(f"Unknown stage: {stage}")
+
+    results = []
+    skipped = []
+    print(f"{'stage':<9} {'claims':>8} {'lines':>6} {'seconds':>9} {'claims/s':>11} {'segs/s':>12} {'peak RSS':>10} {'alloc peak':>12}")
+    for n_claims in args.claims:
+        for n_lines in args.lines:
+            if n_claims * n_lines > args.max_total_lines:
+                skipped.append({"claims": n_claims, "service_lines": n_lines})
+                continue
+            for stage in stages:
+                # Fresh process per case so ru_maxrss is not inherited from earlier cases.
+                with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as pool:
+                    r = pool.submit(run_case, stage, args.claim_type, n_claims, n_lines).result()
+                results.append(r)
+                print(f"{stage:<9} {n_claims:>8} {n_lines:>6} {r['seconds']:>9.3f} {r['claims_per_sec']:>11.1f} "
+                      f"{r['segments_per_sec']:>12.0f} {r['peak_rss_bytes'] / 2**20:>8.1f}MB "
+                      f"{r['alloc_peak_bytes'] / 1024:>10.1f}KB")
+    for s in skipped:
+        print(f"skipped {s['claims']} claims x {s['service_lines']} lines (over --max-total-lines)")
+
+    if args.json:
+        report = {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "claim_type": args.claim_type,
+            "results": results,
+            "skipped": skipped,
+        }
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print("Results:", args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI chat completions API, for exercising edi_openai without the network.
+Answers POST /v1/chat/completions by building the EDI locally (build_edi_content) from the claim
+JSON in the user message, after an optional artificial latency. HTTP/1.1 keep-alive is supported,
+as is "stream": true (server-sent events, one small delta per chunk). --prose answers with
+non-EDI text instead, to exercise the early abort of streamed requests.
+
+Usage (from project root Gen-AI-Dev-Course):
+  python EDI_File_Generator/benchmarks/stub_openai_server.py --port 8765 --latency 0.5
+  python EDI_File_Generator/benchmarks/stub_openai_server.py --prose --chunk-delay 0.05
+  OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub python EDI_File_Generator/benchmarks/bench_openai_async.py
+"""
+import argparse
+import json
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+_project_root = Path(__file__).resolve().parent.parent.parent
+if str(_project_root) not in sys.path:
+    sys.path.insert(0, str(_project_root))
+
+from EDI_File_Generator import build_edi_content, get_loops
+
+PROSE = (
+    "I'm sorry, but I can't produce a complete 837 file from this claim without more information. "
+    "Please provide the billing provider NPI, the subscriber member ID and the service line charges, "
+    "and I will generate the EDI for you. "
+) * 8
+STREAM_CHUNK_CHARS = 16
+
+
+def completion_text(messages: list[dict]) -> str:
+    """EDI for the claim JSON embedded in the last user message (after the first blank line)."""
+    user = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+    _, _, payload = user.partition("\n\n")
+    claim_json = json.loads(payload)
+    claim_type = claim_json.get("claim_type", "837P")
+    edi, _ = build_edi_content(claim_type, dict(claim_json.get("loops", {})), get_loops(claim_type))
+    return edi
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    chunk_delay = 0.0
+    prose = False
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, model: str, content: str):
+        """Send content as chat.completion.chunk server-sent events (chunked transfer encoding)."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        base = {"id": f"chatcmpl-stub-{time.monotonic_ns()}", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": model}
+        deltas = [{"role": "assistant", "content": ""}]
+        deltas += [{"content": content[i:i + STREAM_CHUNK_CHARS]} for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+        try:
+            for i, delta in enumerate(deltas):
+                finish = "stop" if i == len(deltas) - 1 else None
+                event = {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+                self._write_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                if self.chunk_delay:
+                    time.sleep(self.chunk_delay)
+            self._write_chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Client closed the stream early (e.g. edi_openai aborting on non-EDI output).
+            self.close_connection = True
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        try:
+            content = PROSE if self.prose else completion_text(request.get("messages", []))
+        except Exception as e:
+            self._send_json(400, {"error": {"message": f"Stub could not build EDI: {e}"}})
+            return
+        if self.latency:
+            time.sleep(self.latency)
+        if request.get("stream"):
+            self._send_stream(request.get("model", "stub"), content)
+            return
+        self._send_json(200, {
+            "id": f"chatcmpl-stub-{time.monotonic_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": length // 4, "completion_tokens": len(content) // 4,
+                      "total_tokens": (length + len(content)) // 4},
+        })
+
+
+def serve(
+    host: str = "127.0.0.1", port: int = 8765, latency: float = 0.0, chunk_delay: float = 0.0, prose: bool = False
+) -> ThreadingHTTPServer:
+    """Create the stub server (call serve_forever() on it, or run it in a thread)."""
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"latency": latency, "chunk_delay": chunk_delay, "prose": prose})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub OpenAI chat completions server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before answering")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="Seconds between streamed chunks")
+    parser.add_argument("--prose", action="store_true", help="Answer with non-EDI text")
+    args = parser.parse_args()
+    server = serve(args.host, args.port, args.latency, args.chunk_delay, args.prose)
+    print(f"Stub OpenAI API on http://{args.host}:{args.port}/v1 (latency {args.latency}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
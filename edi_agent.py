@@ -2,30 +2,61 @@
 EDI Claim Agent - Orchestrates EDI 837 generation from form data.
 Generates HIPAA-compliant 837P/837I files and saves with timestamped filenames.
 """
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import ExitStack
 from pathlib import Path
-from datetime import datetime
+from typing import Iterable, NamedTuple
 
+from .edi_control import get_allocator
+from .edi_metrics import get_metrics
 from .edi_schemas import get_loops
-from .edi_generator import build_edi_content, recount_se_and_fix
+from .edi_sink import get_output_sink
+from .edi_timing import active_timer, stage, timing
+from .edi_generator import (
+    ValidationIssue,
+    X12Encoder,
+    _group_header,
+    _group_trailer,
+    _iea_segment,
+    _interchange_header,
+    _interchange_trailer,
+    _isa_segment,
+    _validate_required,
+    encoder_for_isa,
+    envelope_control,
+    interchange_control,
+    iter_transaction_set,
+    write_edi,
+)
 
-# Output directory: inside EDI File Generator folder
-EDI_OUTPUT_DIR = Path(__file__).resolve().parent / "edi_output"
-EDI_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-
-def generate_837_file(claim_type: str, form_data: dict) -> dict:
+def generate_837_file(claim_type: str, form_data: dict, timings: bool | None = None) -> dict:
     """
     Generate an 837P or 837I EDI file from user-supplied form data.
     claim_type: "837P" or "837I"
     form_data: Nested dict keyed by loop_id (1000A, 1000B, 2000A, ...), then element ids.
+    timings: add per-stage timings (default EDI_TIMINGS; see edi_timing).
     Returns: {
         "success": bool,
         "file_path": str or None,
         "file_name": str or None,
-        "errors": list[str],
-        "message": str
+        "errors": list of ValidationIssue records (str() renders each; write failures are strings),
+        "message": str,
+        "timings": {"total", "stages", "loops"}  (only with timings)
     }
     """
+    with timing(timings) as timer:
+        result = _generate_837_file(claim_type, form_data)
+    if timer is not None:
+        result["timings"] = timer.as_dict()
+    return result
+
+
+def _generate_837_file(claim_type: str, form_data: dict) -> dict:
     claim_type = claim_type.upper().strip()
     if claim_type not in ("837P", "837I"):
         return {
@@ -48,15 +79,23 @@ def generate_837_file(claim_type: str, form_data: dict) -> dict:
         }
 
     form_data["_ISA"] = form_data.get("_ISA", form_data.get("ISA", {}))
-    edi_content, validation_errors = build_edi_content(claim_type, form_data, loops_schema)
-    edi_content = recount_se_and_fix(edi_content)
-
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    file_name = f"{claim_type}_{timestamp}.edi"
-    file_path = EDI_OUTPUT_DIR / file_name
 
+    # Segments are streamed to a temporary file as they are built (the SE count is kept on the
+    # fly); the output sink renames it to a unique name once complete.
+    validation_errors = []
+    file_name = None
     try:
-        file_path.write_text(edi_content, encoding="utf-8")
+        with stage("control_numbers"):
+            control = interchange_control(form_data["_ISA"])
+        with get_output_sink().open(claim_type, control.isa13) as out:
+            file_name = out.name
+            written, validation_errors = write_edi(
+                out.fp, claim_type, (form_data,), loops_schema, batch=False, control=control
+            )
+            commit_start = time.perf_counter()
+        timer = active_timer()
+        if timer is not None:
+            timer.add("commit", time.perf_counter() - commit_start)
     except Exception as e:
         return {
             "success": False,
@@ -66,6 +105,13 @@ def generate_837_file(claim_type: str, form_data: dict) -> dict:
             "message": f"File could not be saved: {e}",
         }
 
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.claims.inc(claim_type=claim_type, path="local")
+        metrics.files.inc(claim_type=claim_type, path="local")
+        metrics.bytes.inc(written, claim_type=claim_type, path="local")
+    file_path = out.path
+    file_name = out.name
     return {
         "success": True,
         "file_path": str(file_path),
@@ -75,3 +121,404 @@ def generate_837_file(claim_type: str, form_data: dict) -> dict:
             f" ({len(validation_errors)} validation warning(s).)" if validation_errors else "."
         ),
     }
+
+
+# ─── Rollover ────────────────────────────────────────────────────────────────
+
+class RolloverLimits(NamedTuple):
+    """Envelope limits; None means unlimited."""
+    claims_per_st: int | None = 5000
+    sts_per_gs: int | None = None
+    bytes_per_file: int | None = None
+
+
+def _chunks(items: Iterable, size: int | None):
+    """Lists of up to size items (everything in one list when size is None)."""
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class RolloverWriter:
+    """
+    Writes rendered ST..SE transaction sets into as many interchanges as the limits require.
+    A new GS group is opened when the current one holds sts_per_gs sets, and a new file (with
+    fresh ISA13/GS06 control numbers) when the next set plus the trailer would exceed
+    bytes_per_file; GE/IEA counts are kept on the fly. A set larger than bytes_per_file on its
+    own gets a file to itself. Files go through the output sink, so each appears only once its
+    IEA is written. files lists one result dict per finished file.
+    """
+
+    def __init__(
+        self,
+        claim_type: str,
+        _isa: dict | None = None,
+        limits: RolloverLimits | None = None,
+        encoder: X12Encoder | None = None,
+        sink=None,
+    ):
+        self.claim_type = claim_type
+        self.limits = limits or RolloverLimits()
+        self._isa = _isa or {}
+        self._encoder = encoder or encoder_for_isa(self._isa)
+        self._sink = sink or get_output_sink()
+        self._stack = None
+        self._file = None
+        self.files = []
+
+    def _open_file(self):
+        # A user-supplied ISA13 is only used for the first file; later files need their own.
+        control = envelope_control(self._isa if not self.files else {})
+        self._stack = ExitStack()
+        out = self._stack.enter_context(self._sink.open(self.claim_type, control.isa13))
+        header = _isa_segment(self._isa, control.isa13, self._encoder) + _group_header(
+            self.claim_type, control.gs06, self._encoder
+        )
+        out.fp.write(header)
+        self._file = {
+            "out": out, "isa13": control.isa13, "gs06": control.gs06,
+            "groups": 1, "group_sets": 0, "sets": 0, "claims": 0, "bytes": len(header),
+        }
+
+    def _close_file(self):
+        f = self._file
+        trailer = _group_trailer(f["group_sets"], f["gs06"], self._encoder) + _iea_segment(
+            f["groups"], f["isa13"], self._encoder
+        )
+        f["out"].fp.write(trailer)
+        self._stack.close()
+        out = f["out"]
+        metrics = get_metrics()
+        if metrics is not None:
+            metrics.claims.inc(f["claims"], claim_type=self.claim_type, path="batch")
+            metrics.files.inc(claim_type=self.claim_type, path="batch")
+            metrics.bytes.inc(f["bytes"] + len(trailer), claim_type=self.claim_type, path="batch")
+        self.files.append({
+            "success": True,
+            "file_path": str(out.path),
+            "file_name": out.name,
+            "errors": [],
+            "message": f"EDI file generated: {out.name}",
+            "claims": f["claims"],
+            "transaction_sets": f["sets"],
+            "functional_groups": f["groups"],
+            "bytes": f["bytes"] + len(trailer),
+        })
+        self._file = self._stack = None
+
+    def _group_full(self) -> bool:
+        return bool(self.limits.sts_per_gs) and self._file["group_sets"] >= self.limits.sts_per_gs
+
+    def _fits(self, size: int) -> bool:
+        """Whether a set of size bytes (plus any group rollover and the trailer) fits in the file."""
+        f = self._file
+        if not self.limits.bytes_per_file or f["sets"] == 0:
+            return True
+        enc = self._encoder
+        needed = f["bytes"] + size
+        gs06 = f["gs06"]
+        group_sets = f["group_sets"] + 1
+        if self._group_full():
+            # The next GS06 is not allocated yet; assume the widest (9 digits).
+            gs06 = "9" * 9
+            needed += len(_group_trailer(f["group_sets"], f["gs06"], enc)) + len(_group_header(self.claim_type, gs06, enc))
+            group_sets = 1
+        needed += len(_group_trailer(group_sets, gs06, enc)) + len(_iea_segment(f["groups"] + 1, f["isa13"], enc))
+        return needed <= self.limits.bytes_per_file
+
+    def add(self, transaction_set: bytes, claims: int):
+        """Append one rendered transaction set holding claims claims, rolling over as needed."""
+        if self._file is not None and not self._fits(len(transaction_set)):
+            self._close_file()
+        if self._file is None:
+            self._open_file()
+        f = self._file
+        enc = self._encoder
+        if self._group_full():
+            gs06 = str(get_allocator().next("group"))
+            rollover = _group_trailer(f["group_sets"], f["gs06"], enc) + _group_header(self.claim_type, gs06, enc)
+            f["out"].fp.write(rollover)
+            f["bytes"] += len(rollover)
+            f["gs06"] = gs06
+            f["groups"] += 1
+            f["group_sets"] = 0
+        f["out"].fp.write(transaction_set)
+        f["bytes"] += len(transaction_set)
+        f["group_sets"] += 1
+        f["sets"] += 1
+        f["claims"] += claims
+
+    def close(self) -> list[dict]:
+        """Finish the current file; returns the result dicts of all files written."""
+        if self._file is not None:
+            self._close_file()
+        return self.files
+
+    def __enter__(self) -> "RolloverWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        elif self._stack is not None:
+            # Drop the unfinished file (the sink deletes its temporary file).
+            self._stack.__exit__(exc_type, exc, tb)
+            self._file = self._stack = None
+
+
+def generate_837_files(claim_type: str, claims: Iterable[dict], limits: RolloverLimits | None = None) -> dict:
+    """
+    Generate as many 837 files as the limits require from any number of claims (consumed lazily).
+    Claims are packed claims_per_st to a transaction set (batch HL numbering, see build_edi_batch);
+    the envelope (_ISA) comes from the first claim. Returns {"success", "files" (one result dict
+    per file), "claims", "errors" (ValidationIssue records with their transaction_set), "message"}.
+    """
+    claim_type = claim_type.upper().strip()
+    loops_schema = get_loops(claim_type)
+    limits = limits or RolloverLimits()
+    chunks = _chunks(claims, limits.claims_per_st)
+    first = next(chunks, None)
+    if first is None:
+        raise ValueError("claims must contain at least one claim")
+    _isa = first[0].get("_ISA", first[0].get("ISA", {}))
+    encoder = encoder_for_isa(_isa)
+    errors = []
+    n_claims = 0
+    with RolloverWriter(claim_type, _isa, limits, encoder) as writer:
+        for n, chunk in enumerate(itertools.chain((first,), chunks), start=1):
+            # ST02 keeps counting across groups and files, so it is unique within every group.
+            st_control = str(n).zfill(4)
+            chunk_errors = []
+            writer.add(b"".join(iter_transaction_set(
+                claim_type, chunk, loops_schema, chunk_errors, st_control, encoder=encoder
+            )), len(chunk))
+            errors.extend(
+                e._replace(transaction_set=st_control, claim_index=None if e.claim_index is None else n_claims + e.claim_index)
+                for e in chunk_errors
+            )
+            n_claims += len(chunk)
+    files = writer.files
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.record_validation_errors(claim_type, errors)
+    return {
+        "success": True,
+        "files": files,
+        "claims": n_claims,
+        "errors": errors,
+        "message": f"{n_claims} claim(s) written to {len(files)} EDI file(s)" + (
+            f" ({len(errors)} validation warning(s))." if errors else "."
+        ),
+    }
+
+
+# ─── Generation strategy ──────────────────────────────────────────────────────
+
+# local: deterministic generator only. llm: OpenAI only.
+# local_first: deterministic generator when the claim passes validation, OpenAI otherwise.
+GENERATION_STRATEGIES = ("local", "local_first", "llm")
+DEFAULT_STRATEGY = os.getenv("EDI_GENERATION_STRATEGY", "local_first")
+
+_stats_lock = threading.Lock()
+_strategy_stats = {
+    s: {"calls": 0, "seconds": 0.0, "max_seconds": 0.0, "llm_calls": 0, "llm_avoided": 0}
+    for s in GENERATION_STRATEGIES
+}
+
+
+def generation_stats() -> dict:
+    """Per-strategy counters: calls, total/max latency, LLM calls made and LLM calls avoided."""
+    with _stats_lock:
+        return {s: dict(v) for s, v in _strategy_stats.items()}
+
+
+def _generate_via_llm(claim_type: str, form_data: dict, on_segment=None) -> dict:
+    from .edi_openai import build_claim_json, generate_837_via_openai
+    return generate_837_via_openai(claim_type, build_claim_json(form_data, claim_type), on_segment=on_segment)
+
+
+def generate_837(
+    claim_type: str, form_data: dict, strategy: str | None = None, on_segment=None, timings: bool | None = None
+) -> dict:
+    """
+    Generate an 837 file with the given strategy (see GENERATION_STRATEGIES; default
+    DEFAULT_STRATEGY, from EDI_GENERATION_STRATEGY). Returns the generate_837_file result dict
+    plus "strategy" and "used_llm". When local_first escalates and OpenAI also fails, the local
+    validation errors are included so callers can point at the missing fields.
+    on_segment: if given, OpenAI output is streamed and each segment is passed to it as it arrives.
+    timings: add per-stage timings of whichever path ran (see generate_837_file).
+    """
+    strategy = strategy or DEFAULT_STRATEGY
+    if strategy not in GENERATION_STRATEGIES:
+        return {
+            "success": False,
+            "file_path": None,
+            "file_name": None,
+            "errors": [f"Invalid generation strategy: {strategy}. Use one of {', '.join(GENERATION_STRATEGIES)}."],
+            "message": "Invalid generation strategy.",
+        }
+
+    start = time.perf_counter()
+    used_llm = False
+    with timing(timings) as timer:
+        if strategy == "local":
+            result = generate_837_file(claim_type, form_data)
+        elif strategy == "llm":
+            used_llm = True
+            result = _generate_via_llm(claim_type, form_data, on_segment)
+        else:
+            validation_errors = []
+            try:
+                with stage("precheck"):
+                    validation_errors = _validate_required(form_data, get_loops(claim_type.upper().strip()))
+            except ValueError:
+                pass
+            if not validation_errors:
+                result = generate_837_file(claim_type, form_data)
+            else:
+                used_llm = True
+                result = _generate_via_llm(claim_type, form_data, on_segment)
+                if not result["success"]:
+                    result["errors"] = validation_errors + result["errors"]
+    elapsed = time.perf_counter() - start
+    if timer is not None:
+        result["timings"] = timer.as_dict()
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.generation_seconds.observe(elapsed, claim_type=claim_type.upper().strip(), strategy=strategy)
+
+    with _stats_lock:
+        stats = _strategy_stats[strategy]
+        stats["calls"] += 1
+        stats["seconds"] += elapsed
+        stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+        if used_llm:
+            stats["llm_calls"] += 1
+        elif strategy == "local_first":
+            stats["llm_avoided"] += 1
+    result["strategy"] = strategy
+    result["used_llm"] = used_llm
+    return result
+
+
+class OpenInterchange:
+    """
+    An 837 interchange kept open on disk while claims arrive (e.g. one file per hour).
+    Each append() writes one new ST..SE transaction set at the end of the file and rewrites
+    only the short GE/IEA trailer after it, so the file is a complete interchange after every
+    append and earlier claims are never buffered or reread. Until close() the file is kept
+    under a hidden ".<file>.part" name, so pickup jobs never see it; close() publishes it as
+    file_path through the output sink (link/rename, never overwriting). Progress (trailer
+    offset, counts, control numbers) is kept in a "<file>.open" JSON sidecar so a restarted
+    process resumes the same interchange; close() drops the sidecar. One writer per file.
+    """
+
+    def __init__(self, file_path: Path, state: dict):
+        self.file_path = file_path
+        self._work_path = file_path.with_name(f".{file_path.name}.part")
+        self._state_path = file_path.with_name(file_path.name + ".open")
+        self._state = state
+        self._closed = False
+        self._loops_schema = get_loops(state["claim_type"])
+        self._encoder = encoder_for_isa(state["isa"])
+
+    @classmethod
+    def open(cls, claim_type: str, file_path: str | Path | None = None, isa: dict | None = None) -> "OpenInterchange":
+        """
+        Resume the open interchange to be published as file_path, or start a new one (ISA/GS
+        written now; file_path defaults to a new name from the output sink).
+        """
+        claim_type = claim_type.upper().strip()
+        get_loops(claim_type)
+        control = None
+        if file_path is None:
+            control = envelope_control(isa or {})
+            file_path = get_output_sink().new_path(claim_type, control.isa13)
+        file_path = Path(file_path)
+        state_path = file_path.with_name(file_path.name + ".open")
+        if state_path.exists():
+            state = json.loads(state_path.read_text(encoding="utf-8"))
+            if state["claim_type"] != claim_type:
+                raise ValueError(f"{file_path.name} is an open {state['claim_type']} interchange, not {claim_type}.")
+            return cls(file_path, state)
+
+        isa = dict(isa or {})
+        control = control or envelope_control(isa)
+        state = {
+            "claim_type": claim_type,
+            "isa": {k: isa[k] for k in ("ISA11", "ISA16") if isa.get(k)},
+            "gs_id": control.gs06,
+            "isa13": control.isa13,
+            "st_count": 0,
+            "claim_count": 0,
+        }
+        interchange = cls(file_path, state)
+        header = b"".join(_interchange_header(claim_type, isa, state["isa13"], state["gs_id"], interchange._encoder))
+        with open(interchange._work_path, "wb") as fp:
+            fp.write(header)
+            fp.write(interchange._trailer_bytes())
+        state["trailer_offset"] = len(header)
+        interchange._save_state()
+        return interchange
+
+    def _trailer_bytes(self) -> bytes:
+        state = self._state
+        return b"".join(_interchange_trailer(state["st_count"], state["isa13"], state["gs_id"], self._encoder))
+
+    def _save_state(self):
+        tmp_path = self._state_path.with_name(self._state_path.name + ".tmp")
+        tmp_path.write_text(json.dumps(self._state), encoding="utf-8")
+        os.replace(tmp_path, self._state_path)
+
+    @property
+    def transaction_count(self) -> int:
+        return self._state["st_count"]
+
+    @property
+    def claim_count(self) -> int:
+        return self._state["claim_count"]
+
+    def append(self, claims: dict | list[dict]) -> list[ValidationIssue]:
+        """
+        Append one transaction set holding the given claim(s) (batch HL numbering, see
+        build_edi_batch) and rewrite the trailer. Returns its ValidationIssue records.
+        """
+        if self._closed:
+            raise ValueError(f"{self.file_path.name} is closed.")
+        if isinstance(claims, dict):
+            claims = [claims]
+        state = self._state
+        st_control = str(state["st_count"] + 1).zfill(4)
+        errors = []
+        with open(self._work_path, "r+b") as fp:
+            # Anything past the recorded trailer offset (old trailer or a torn write) is replaced.
+            fp.seek(state["trailer_offset"])
+            fp.write(b"".join(iter_transaction_set(
+                state["claim_type"], claims, self._loops_schema, errors, st_control, encoder=self._encoder
+            )))
+            trailer_offset = fp.tell()
+            state["st_count"] += 1
+            state["claim_count"] += len(claims)
+            fp.write(self._trailer_bytes())
+            fp.truncate()
+        state["trailer_offset"] = trailer_offset
+        self._save_state()
+        return errors
+
+    def close(self) -> dict:
+        """Finish and publish the interchange; returns a result dict like generate_837_file."""
+        if self._closed:
+            raise ValueError(f"{self.file_path.name} is closed.")
+        self.file_path = get_output_sink().publish(self._work_path, self.file_path)
+        self._state_path.unlink(missing_ok=True)
+        self._closed = True
+        return {
+            "success": True,
+            "file_path": str(self.file_path),
+            "file_name": self.file_path.name,
+            "errors": [],
+            "message": f"EDI file closed: {self.file_path.name} ({self.transaction_count} transaction set(s)).",
+        }
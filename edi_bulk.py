@@ -0,0 +1,308 @@
+"""
+Bulk 837 generation: claims from CSV/JSONL, built one transaction set per chunk across a
+process pool and written through RolloverWriter. BulkJobManager runs such batches in the
+background of a long-lived process (the Streamlit server) and tracks their progress.
+"""
+import csv
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator
+
+from .edi_agent import RolloverLimits, RolloverWriter, _chunks
+from .edi_generator import X12Encoder, encoder_for_isa, iter_transaction_set
+from .edi_metrics import get_metrics
+from .edi_schemas import get_loops
+
+# ISA overrides accepted as ISA_<id> columns (same fields as the UI).
+ISA_COLUMNS = ("ISA06", "ISA08", "ISA13")
+_LINE_COLUMN = re.compile(r"2400_(\d+)_(.+)")
+
+
+# ─── Input formats ────────────────────────────────────────────────────────────
+
+def csv_columns(claim_type: str, service_lines: int = 1) -> list[str]:
+    """
+    CSV header accepted for claim_type: <loop_id>_<element_id> (e.g. 2300_CLM01), 2400_<n>_<element_id>
+    for service line n (0-based) and ISA_<element_id> for the interchange overrides.
+    """
+    columns = [f"ISA_{el_id}" for el_id in ISA_COLUMNS]
+    for loop_def in get_loops(claim_type):
+        el_ids = [el["id"] for seg in loop_def.get("segments", []) for el in seg.get("elements", [])]
+        if loop_def["loop_id"] == "2400":
+            columns += [f"2400_{i}_{el_id}" for i in range(service_lines) for el_id in el_ids]
+        else:
+            columns += [f"{loop_def['loop_id']}_{el_id}" for el_id in el_ids]
+    return columns
+
+
+def _column_map(claim_type: str, header: list[str]) -> list[tuple]:
+    """(column, loop_id, line index or None, el_id) per CSV column; ValueError on unknown columns."""
+    known = {}
+    line_el_ids = set()
+    for loop_def in get_loops(claim_type):
+        for seg in loop_def.get("segments", []):
+            for el in seg.get("elements", []):
+                if loop_def["loop_id"] == "2400":
+                    line_el_ids.add(el["id"])
+                else:
+                    known[f"{loop_def['loop_id']}_{el['id']}"] = (loop_def["loop_id"], el["id"])
+    known.update({f"ISA_{el_id}": ("ISA", el_id) for el_id in ISA_COLUMNS})
+
+    mapping = []
+    unknown = []
+    for column in header:
+        name = column.strip()
+        if name in known:
+            mapping.append((column, known[name][0], None, known[name][1]))
+            continue
+        m = _LINE_COLUMN.fullmatch(name)
+        if m and m.group(2) in line_el_ids:
+            mapping.append((column, "2400", int(m.group(1)), m.group(2)))
+        elif name:
+            unknown.append(name)
+    if unknown:
+        raise ValueError(f"Unknown {claim_type} CSV column(s): {', '.join(unknown[:10])}" + (" ..." if len(unknown) > 10 else ""))
+    return mapping
+
+
+def iter_csv_claims(lines: Iterable[str], claim_type: str) -> Iterator[dict]:
+    """Yield form_data dicts from CSV rows (see csv_columns); empty cells are left out."""
+    reader = csv.DictReader(lines)
+    mapping = _column_map(claim_type, reader.fieldnames or [])
+    for row in reader:
+        form_data = {}
+        for column, loop_id, index, el_id in mapping:
+            value = (row.get(column) or "").strip()
+            if not value:
+                continue
+            if index is None:
+                form_data.setdefault(loop_id, {})[el_id] = value
+            else:
+                service_lines = form_data.setdefault("2400", [])
+                while len(service_lines) <= index:
+                    service_lines.append({})
+                service_lines[index][el_id] = value
+        if "2400" in form_data:
+            form_data["2400"] = [line for line in form_data["2400"] if line]
+        form_data["_ISA"] = form_data.pop("ISA", {})
+        yield form_data
+
+
+def iter_jsonl_claims(lines: Iterable[str]) -> Iterator[dict]:
+    """Yield form_data dicts from JSON Lines (one claim per line, blank lines skipped)."""
+    for n, line in enumerate(lines, start=1):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Line {n}: invalid JSON ({e.msg}).") from None
+
+
+def parse_claims(data: bytes, fmt: str, claim_type: str) -> list[dict]:
+    """Claims from an uploaded file; fmt is "csv" or "jsonl"."""
+    lines = io.StringIO(data.decode("utf-8-sig"), newline="")
+    if fmt == "csv":
+        return list(iter_csv_claims(lines, claim_type))
+    if fmt == "jsonl":
+        return list(iter_jsonl_claims(lines))
+    raise ValueError(f"Unsupported format: {fmt}. Use csv or jsonl.")
+
+
+# ─── Generation ───────────────────────────────────────────────────────────────
+
+def build_transaction_set(claim_type: str, chunk_index: int, claims: list, encoder: X12Encoder) -> tuple:
+    """Worker: build one ST..SE transaction set. Returns (pid, n_claims, seconds, edi_bytes, errors)."""
+    start = time.perf_counter()
+    st_control = str(chunk_index + 1).zfill(4)
+    errors = []
+    edi = b"".join(iter_transaction_set(claim_type, claims, get_loops(claim_type), errors, st_control, encoder=encoder))
+    errors = [e._replace(transaction_set=st_control) for e in errors]
+    return os.getpid(), len(claims), time.perf_counter() - start, edi, errors
+
+
+def generate_bulk(
+    claim_type: str,
+    claims: Iterable[dict],
+    pool: Executor,
+    limits: RolloverLimits | None = None,
+    window: int = 8,
+    on_progress: Callable[[int, int], None] | None = None,
+) -> dict:
+    """
+    Build interchanges from claims (consumed lazily) on pool. Each chunk of limits.claims_per_st
+    claims becomes one transaction set; sets are written in input order, rolling over to new
+    groups/files at the limits. At most window chunks are in flight. on_progress(claims, sets)
+    is called after each set is written.
+    Returns a summary dict (files, claims, transaction_sets, seconds, errors, per_worker).
+    """
+    limits = limits or RolloverLimits()
+    chunks = _chunks(claims, limits.claims_per_st)
+    first = next(chunks, None)
+    if first is None:
+        raise ValueError("No claims found.")
+    chunks = itertools.chain((first,), chunks)
+
+    per_worker = {}
+    errors = []
+    metrics = get_metrics()
+    n_claims = n_sets = 0
+    start = time.perf_counter()
+
+    def collect(future):
+        nonlocal n_claims, n_sets
+        pid, count, seconds, edi, chunk_errors = future.result()
+        writer.add(edi, count)
+        # Chunk issues count claims from 0; shift them onto the input stream.
+        chunk_errors = [e if e.claim_index is None else e._replace(claim_index=n_claims + e.claim_index) for e in chunk_errors]
+        errors.extend(chunk_errors)
+        if metrics is not None:
+            metrics.record_validation_errors(claim_type, chunk_errors)
+        n_claims += count
+        n_sets += 1
+        stats = per_worker.setdefault(pid, {"claims": 0, "seconds": 0.0})
+        stats["claims"] += count
+        stats["seconds"] += seconds
+        if on_progress is not None:
+            on_progress(n_claims, n_sets)
+
+    _isa = first[0].get("_ISA", first[0].get("ISA", {}))
+    encoder = encoder_for_isa(_isa)
+    # Each file only appears under its final name once its trailer is written.
+    with RolloverWriter(claim_type, _isa, limits, encoder) as writer:
+        # Bounded window of in-flight chunks; FIFO completion keeps the output in input order.
+        pending = deque()
+        for chunk_index, chunk in enumerate(chunks):
+            pending.append(pool.submit(build_transaction_set, claim_type, chunk_index, chunk, encoder))
+            if len(pending) >= window:
+                collect(pending.popleft())
+        while pending:
+            collect(pending.popleft())
+
+    return {
+        "files": [f["file_path"] for f in writer.files],
+        "claims": n_claims,
+        "transaction_sets": n_sets,
+        "seconds": time.perf_counter() - start,
+        "errors": errors,
+        "per_worker": per_worker,
+    }
+
+
+# ─── Background jobs ──────────────────────────────────────────────────────────
+
+class BulkJob:
+    """Status of one background batch; updated by the job thread, read by any session."""
+
+    def __init__(self, claim_type: str, name: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.claim_type = claim_type
+        self.name = name
+        self.status = "queued"
+        self.total = None
+        self.claims_done = 0
+        self.sets_done = 0
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.summary = None
+        self.error = None
+
+    @property
+    def progress(self) -> float:
+        return self.claims_done / self.total if self.total else 0.0
+
+    @property
+    def claims_per_sec(self) -> float:
+        if self.started is None:
+            return 0.0
+        elapsed = (self.finished or time.time()) - self.started
+        return self.claims_done / elapsed if elapsed > 0 else 0.0
+
+    def _on_progress(self, claims: int, sets: int):
+        self.claims_done = claims
+        self.sets_done = sets
+
+
+class BulkJobManager:
+    """
+    Runs bulk jobs for the whole process: max_jobs job threads share one process pool of
+    workers processes (spawned, so a threaded server is never forked). The most recent
+    keep_jobs jobs are kept for status display.
+    """
+
+    def __init__(self, workers: int | None = None, max_jobs: int = 2, keep_jobs: int = 50):
+        self.workers = workers or int(os.getenv("EDI_BULK_WORKERS", 0)) or os.cpu_count() or 1
+        self.keep_jobs = keep_jobs
+        self._runner = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="edi-bulk")
+        self._pool = None
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def submit(self, claim_type: str, data: bytes, fmt: str, name: str = "", limits: RolloverLimits | None = None) -> BulkJob:
+        """Queue an uploaded file (fmt "csv" or "jsonl"); parsing and generation run in the background."""
+        claim_type = claim_type.upper().strip()
+        get_loops(claim_type)
+        job = BulkJob(claim_type, name)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.keep_jobs:
+                self._jobs.popitem(last=False)
+        self._runner.submit(self._run, job, data, fmt, limits or RolloverLimits(claims_per_st=500))
+        return job
+
+    def _run(self, job: BulkJob, data: bytes, fmt: str, limits: RolloverLimits):
+        job.status = "running"
+        job.started = time.time()
+        try:
+            claims = parse_claims(data, fmt, job.claim_type)
+            job.total = len(claims)
+            job.summary = generate_bulk(
+                job.claim_type, claims, self._get_pool(), limits, self.workers * 2, job._on_progress
+            )
+            job.status = "done"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished = time.time()
+
+    def get(self, job_id: str) -> BulkJob | None:
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> list[BulkJob]:
+        """All kept jobs, newest first."""
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def shutdown(self):
+        self._runner.shutdown(wait=True)
+        if self._pool is not None:
+            self._pool.shutdown()
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> BulkJobManager:
+    """Process-wide job manager (EDI_BULK_WORKERS sets the worker process count)."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = BulkJobManager()
+        return _manager
@@ -0,0 +1,154 @@
+"""
+Content-addressed on-disk cache for OpenAI-generated EDI.
+Entries are keyed by a SHA-256 of the canonicalized claim JSON, claim type, model and system
+prompt, expire after a TTL, and are evicted least-recently-used once the cache exceeds its size.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+# After an eviction the cache is trimmed to this fraction of max_bytes.
+_EVICT_TARGET = 0.9
+
+
+def _canonical(value: Any) -> Any:
+    """Strip string values and drop empty ones so cosmetic differences map to the same key."""
+    if isinstance(value, dict):
+        out = {}
+        for k, v in value.items():
+            v = _canonical(v)
+            if v not in ("", None, {}, []):
+                out[str(k)] = v
+        return out
+    if isinstance(value, list):
+        return [_canonical(v) for v in value]
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def cache_key(claim_type: str, claim_json: dict, model: str, system_prompt: str) -> str:
+    """Hex SHA-256 identifying one generation request."""
+    payload = json.dumps(
+        [claim_type.upper().strip(), model, system_prompt, _canonical(claim_json)],
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache of response texts under cache_dir/<key[:2]>/<key>.
+    Each file starts with its creation time (for the TTL); its mtime is the last access (for LRU).
+    Safe to share between threads; processes sharing a directory may briefly overshoot max_bytes.
+    """
+
+    def __init__(self, cache_dir: str | Path, max_bytes: int = DEFAULT_MAX_BYTES, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._bytes = None
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / key
+
+    def _entries(self) -> list[tuple[float, int, Path]]:
+        entries = []
+        if not self.cache_dir.exists():
+            return entries
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, Path(entry.path)))
+        return entries
+
+    def get(self, key: str) -> str | None:
+        """Cached text for key, or None on a miss or expired entry."""
+        path = self._path(key)
+        try:
+            created, _, text = path.read_text(encoding="utf-8").partition("\n")
+            expired = time.time() - float(created) > self.ttl_seconds
+        except (FileNotFoundError, ValueError):
+            text, expired = None, False
+        if expired:
+            path.unlink(missing_ok=True)
+            text = None
+        with self._lock:
+            if text is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return text
+
+    def put(self, key: str, text: str) -> None:
+        """Store text under key (atomic replace) and evict LRU entries if over max_bytes."""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = f"{time.time()}\n{text}".encode("utf-8")
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        with self._lock:
+            try:
+                replaced = path.stat().st_size
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)
+            if self._bytes is None:
+                self._bytes = sum(size for _, size, _ in self._entries())
+            else:
+                self._bytes += len(data) - replaced
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Delete least-recently-used entries until under the target size (lock held)."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * _EVICT_TARGET
+        for _, size, path in entries:
+            if total <= target:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+        self._bytes = total
+
+    def clear(self) -> None:
+        with self._lock:
+            for _, _, path in self._entries():
+                path.unlink(missing_ok=True)
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """Hit/miss counters for this process plus current on-disk size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            entries = self._entries()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(entries),
+                "bytes": sum(size for _, size, _ in entries),
+            }
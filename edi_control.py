@@ -0,0 +1,137 @@
+"""
+Control number allocator for ISA13 (interchange), GS06 (group) and ST02 (transaction set).
+Numbers come from a SQLite sequence table shared by all processes on the machine; each process
+reserves them in blocks (one short write transaction per block) and hands them out from memory,
+so parallel workers never issue the same number. Numbers increase within a process; blocks
+abandoned by an exiting process leave gaps, which X12 allows.
+"""
+import os
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, NamedTuple
+
+if TYPE_CHECKING:
+    import sqlite3
+
+SEQUENCES = ("interchange", "group", "transaction")
+# ISA13 and GS06 are at most 9 digits; sequences wrap back to 1 after this.
+MAX_CONTROL_NUMBER = 999_999_999
+DEFAULT_BLOCK_SIZE = 100
+DEFAULT_DB_PATH = Path(
+    os.getenv("EDI_CONTROL_NUMBERS_DB") or Path(__file__).parent / "edi_output" / "control_numbers.sqlite3"
+)
+
+
+class InterchangeControl(NamedTuple):
+    """Control numbers for one interchange: ISA13/IEA02, GS06/GE02 and ST02/SE02 of its first set."""
+    isa13: str
+    gs06: str
+    st02: str
+
+
+class ControlNumberAllocator:
+    """
+    Hands out unique control numbers from the sequences in the SQLite file at path.
+    Safe to share between threads; after a fork the child drops the parent's blocks and
+    connection and reserves its own.
+    """
+
+    def __init__(self, path: str | Path = DEFAULT_DB_PATH, block_size: int = DEFAULT_BLOCK_SIZE, start: int = 1):
+        if block_size < 1:
+            raise ValueError("block_size must be at least 1")
+        self.path = Path(path)
+        self.block_size = block_size
+        self.start = start
+        self._lock = threading.Lock()
+        self._pid = None
+        self._conn = None
+        self._blocks = {}
+
+    def _connect(self) -> "sqlite3.Connection":
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._blocks = {}
+            import sqlite3
+
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS control_numbers (sequence TEXT PRIMARY KEY, next_value INTEGER NOT NULL)"
+            )
+        return self._conn
+
+    def _reserve(self, sequence: str) -> range:
+        """Claim the next block of sequence in one IMMEDIATE transaction (blocks other writers)."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT next_value FROM control_numbers WHERE sequence = ?", (sequence,)).fetchone()
+            first = row[0] if row else self.start
+            if first + self.block_size - 1 > MAX_CONTROL_NUMBER:
+                first = 1
+            conn.execute(
+                "INSERT OR REPLACE INTO control_numbers (sequence, next_value) VALUES (?, ?)",
+                (sequence, first + self.block_size),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return range(first, first + self.block_size)
+
+    def next(self, sequence: str) -> int:
+        """Next number of sequence (one of SEQUENCES)."""
+        if sequence not in SEQUENCES:
+            raise ValueError(f"Unknown control number sequence: {sequence}. Use one of {', '.join(SEQUENCES)}.")
+        with self._lock:
+            self._connect()
+            block = self._blocks.get(sequence)
+            number = next(block, None) if block is not None else None
+            if number is None:
+                self._blocks[sequence] = block = iter(self._reserve(sequence))
+                number = next(block)
+            return number
+
+    def interchange(self, isa13: str | None = None) -> InterchangeControl:
+        """Numbers for a new interchange; isa13 overrides the allocated ISA13 (e.g. from _ISA)."""
+        return self.envelope(isa13)._replace(st02=str(self.next("transaction")).zfill(4))
+
+    def envelope(self, isa13: str | None = None) -> InterchangeControl:
+        """
+        ISA13 and GS06 only (st02 is ""), for writers that number their transaction sets
+        themselves, so no transaction number is used up.
+        """
+        return InterchangeControl(
+            isa13=(isa13 or str(self.next("interchange"))).rjust(9, "0")[-9:],
+            gs06=str(self.next("group")),
+            st02="",
+        )
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+            self._pid = None
+            self._blocks = {}
+
+
+_allocator = None
+_allocator_lock = threading.Lock()
+
+
+def get_allocator() -> ControlNumberAllocator:
+    """Process-wide allocator on DEFAULT_DB_PATH (EDI_CONTROL_NUMBERS_DB to relocate it)."""
+    global _allocator
+    with _allocator_lock:
+        if _allocator is None:
+            _allocator = ControlNumberAllocator()
+        return _allocator
+
+
+def set_allocator(allocator: ControlNumberAllocator) -> ControlNumberAllocator:
+    """Replace the process-wide allocator (e.g. a different database or block size); returns the old one."""
+    global _allocator
+    with _allocator_lock:
+        previous, _allocator = _allocator, allocator
+        return previous
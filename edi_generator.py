@@ -1,17 +1,37 @@
 """
 EDI 837 Generator - Builds HIPAA-compliant 837P/837I X12 files.
-Implements SNIP Level 2 validations: segment syntax, required elements, and IG requirements.
+Implements SNIP Level 2 validations: segment syntax, required elements, and IG requirements;
+SNIP 3/4 rules (balancing, HL structure, dates) run on the built segments (see edi_rules).
 """
+import functools
+import itertools
+import operator
 import re
-from typing import Any
+import time
+from collections import OrderedDict
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, NamedTuple
 from datetime import datetime
 
+from .edi_control import InterchangeControl, get_allocator
+from .edi_metrics import get_metrics
+from .edi_rules import (
+    RULE_REQUIRED_ELEMENT,
+    RULE_REQUIRED_LOOP,
+    ValidationIssue,
+    get_rule_engine,
+)
+from .edi_timing import active_timer, stage
+
 # X12 5010 delimiters (HIPAA standard)
 SEGMENT_TERMINATOR = "~"
 ELEMENT_SEPARATOR = "*"
 COMPONENT_SEPARATOR = ":"
 REPETITION_SEPARATOR = "^"
 
+_MISSING = object()
+_DATE_STRIP = re.compile(r"[-\s]")
+_RD8_RANGE = re.compile(r"\d{8}-\d{8}$")
+
 
 def _sanitize(value: Any) -> str:
     """Remove invalid X12 characters from a value."""
@@ -23,122 +43,663 @@ def _sanitize(value: Any) -> str:
     return s
 
 
-def _validate_required(loop_data: dict, loops_schema: list) -> list[str]:
-    """SNIP2-style: Check required elements are present. Returns list of error messages."""
+# First character (after strip) of a value that might sanitize to "": empty, or a delimiter.
+_SUSPECT_FIRST = frozenset(("", SEGMENT_TERMINATOR, ELEMENT_SEPARATOR, COMPONENT_SEPARATOR, REPETITION_SEPARATOR))
+_FIRST_CHAR = operator.itemgetter(slice(0, 1))
+
+
+def _is_blank(value: Any) -> bool:
+    """True if value is empty after _sanitize; only values starting with a delimiter are sanitized here."""
+    if value is None:
+        return True
+    s = value.strip() if isinstance(value, str) else str(value).strip()
+    return s[:1] in _SUSPECT_FIRST and not _sanitize(s)
+
+
+# validate_required_batch rows (the same record; kept under its earlier name).
+RequiredElementError = ValidationIssue
+
+
+def _validate_required(loop_data: dict, loops_schema: list, claim_index: int | None = None) -> list[ValidationIssue]:
+    """SNIP2-style: Check required elements are present. Returns ValidationIssue records."""
     errors = []
-    for loop_def in loops_schema:
-        loop_id = loop_def["loop_id"]
+    for loop in compile_loops(loops_schema):
+        if not loop.required:
+            continue
+        loop_id = loop.loop_id
         loop_values = loop_data.get(loop_id, {})
         if isinstance(loop_values, list):
             for i, item in enumerate(loop_values):
-                for seg in loop_def.get("segments", []):
-                    for el in seg.get("elements", []):
-                        if el.get("required"):
-                            key = el["id"] if i == 0 else f"{el['id']}_{i}"
-                            val = item.get(el["id"], item.get(key, ""))
-                            if not _sanitize(val):
-                                errors.append(f"Loop {loop_id}[{i}]: Required {el['id']} ({el['label']}) is missing.")
+                for el_id, label in loop.required:
+                    val = item.get(el_id, _MISSING)
+                    if val is _MISSING:
+                        # Later repetitions may carry suffixed keys (LX01_1, ...).
+                        val = item.get(f"{el_id}_{i}", "") if i else ""
+                    if _is_blank(val):
+                        errors.append(ValidationIssue(claim_index, loop_id, el_id, i, RULE_REQUIRED_ELEMENT, label))
         else:
-            for seg in loop_def.get("segments", []):
-                for el in seg.get("elements", []):
-                    if el.get("required"):
-                        val = loop_values.get(el["id"], "")
-                        if not _sanitize(val):
-                            errors.append(f"Loop {loop_id}: Required {el['id']} ({el['label']}) is missing.")
+            for el_id, label in loop.required:
+                if _is_blank(loop_values.get(el_id, "")):
+                    errors.append(ValidationIssue(claim_index, loop_id, el_id, None, RULE_REQUIRED_ELEMENT, label))
     return errors
 
 
-def _build_segment(seg_id: str, elements: list[str]) -> str:
-    """Build one X12 segment: ID*el1*el2*el3~"""
-    parts = [seg_id]
-    for el in elements:
-        parts.append(_sanitize(el))
-    return ELEMENT_SEPARATOR.join(parts) + SEGMENT_TERMINATOR
+def _blank_positions(column: list) -> list[int]:
+    """Positions in column whose value is empty after _sanitize (one C-level pass over the column)."""
+    try:
+        suspects = list(itertools.compress(
+            itertools.count(),
+            map(_SUSPECT_FIRST.__contains__, map(_FIRST_CHAR, map(str.strip, column))),
+        ))
+    except TypeError:
+        # Column holds non-string values (None, numbers): check each one.
+        return [pos for pos, val in enumerate(column) if not _sanitize(val)]
+    # A stripped value that starts with anything else can never sanitize to "".
+    return [pos for pos in suspects if not _sanitize(column[pos])]
+
+
+def validate_required_batch(claims: list[dict], loops_schema: list) -> list[ValidationIssue]:
+    """
+    Columnar SNIP2 required-element check over many claims (same rules as _validate_required).
+    Each loop's rows are gathered once, each required element is pulled into one column and
+    checked in a single pass. Returns ValidationIssue records ordered by claim index.
+    """
+    errors = []
+    for loop in compile_loops(loops_schema):
+        if not loop.required:
+            continue
+        loop_id = loop.loop_id
+        single_rows = []
+        single_claims = []
+        repeat_rows = []
+        repeat_keys = []
+        for n, claim in enumerate(claims):
+            loop_values = claim.get(loop_id, {})
+            if isinstance(loop_values, list):
+                for i, item in enumerate(loop_values):
+                    repeat_rows.append(item)
+                    repeat_keys.append((n, i))
+            else:
+                single_rows.append(loop_values)
+                single_claims.append(n)
+
+        for el_id, label in loop.required:
+            if single_rows:
+                column = list(map(operator.methodcaller("get", el_id, ""), single_rows))
+                for pos in _blank_positions(column):
+                    errors.append(ValidationIssue(single_claims[pos], loop_id, el_id, None, RULE_REQUIRED_ELEMENT, label))
+            if repeat_rows:
+                column = []
+                for row, (_, i) in zip(repeat_rows, repeat_keys):
+                    val = row.get(el_id, _MISSING)
+                    if val is _MISSING:
+                        val = row.get(f"{el_id}_{i}", "") if i else ""
+                    column.append(val)
+                for pos in _blank_positions(column):
+                    n, i = repeat_keys[pos]
+                    errors.append(ValidationIssue(n, loop_id, el_id, i, RULE_REQUIRED_ELEMENT, label))
+    errors.sort(key=lambda e: e.claim_index)
+    return errors
 
 
 def _format_date(d: str) -> str:
-    """Convert YYYY-MM-DD or similar to YYYYMMDD for DTP."""
+    """Convert YYYY-MM-DD or similar to YYYYMMDD for DTP; RD8 ranges (CCYYMMDD-CCYYMMDD) are kept."""
     if not d:
         return ""
-    d = re.sub(r"[-\s]", "", str(d))
+    if _RD8_RANGE.match(str(d).strip()):
+        return str(d).strip()
+    d = _DATE_STRIP.sub("", str(d))
     return d[:8] if len(d) >= 8 else d
 
 
-def build_edi_content(claim_type: str, form_data: dict, loops_schema: list) -> tuple[str, list[str]]:
+# ─── Encoder ──────────────────────────────────────────────────────────────────
+
+class X12Encoder:
     """
-    Build full EDI 837 (with ISA/GS/ST envelope) from form data.
-    Returns (edi_string, validation_errors).
+    Encodes element values and segments to bytes for one delimiter set.
+    Each value is stripped, encoded and has every delimiter removed in a single
+    bytes.translate pass against a precomputed deletion table.
     """
-    errors = _validate_required(form_data, loops_schema)
-    segments_out = []
 
-    _isa = form_data.get("_ISA", form_data.get("ISA", {}))
-    isa01 = (_isa.get("ISA01") or "00").ljust(2)[:2]
-    isa02 = (_isa.get("ISA02") or "").ljust(10)[:10]
-    isa03 = (_isa.get("ISA03") or "00").ljust(2)[:2]
-    isa04 = (_isa.get("ISA04") or "").ljust(10)[:10]
-    isa05 = (_isa.get("ISA05") or "01").ljust(2)[:2]
-    isa06 = (_isa.get("ISA06") or "SENDER").ljust(15)[:15]
-    isa07 = (_isa.get("ISA07") or "01").ljust(2)[:2]
-    isa08 = (_isa.get("ISA08") or "RECEIVER").ljust(15)[:15]
+    def __init__(
+        self,
+        element: str = ELEMENT_SEPARATOR,
+        component: str = COMPONENT_SEPARATOR,
+        repetition: str = REPETITION_SEPARATOR,
+        terminator: str = SEGMENT_TERMINATOR,
+        encoding: str = "utf-8",
+    ):
+        self.element = element
+        self.component = component
+        self.repetition = repetition
+        self.terminator = terminator
+        self.encoding = encoding
+        delimiters = element + component + repetition + terminator
+        self._delete = delimiters.encode(encoding)
+        self._text_table = str.maketrans("", "", delimiters)
+        self._sep = element.encode(encoding)
+        self._term = terminator.encode(encoding)
+        self._prefixes: dict[str, bytes] = {}
+
+    def __repr__(self) -> str:
+        return (f"X12Encoder(element={self.element!r}, component={self.component!r}, "
+                f"repetition={self.repetition!r}, terminator={self.terminator!r}, encoding={self.encoding!r})")
+
+    def __reduce__(self):
+        return (X12Encoder, (self.element, self.component, self.repetition, self.terminator, self.encoding))
+
+    def value(self, value: Any) -> bytes:
+        """Sanitized, encoded element value (b"" for None/blank)."""
+        if value is None:
+            return b""
+        if type(value) is not str:
+            value = str(value)
+        return value.strip().encode(self.encoding).translate(None, self._delete)
+
+    def text(self, value: Any) -> str:
+        """Sanitized value as text (same rules as value())."""
+        if value is None:
+            return ""
+        return str(value).strip().translate(self._text_table)
+
+    def prefix(self, seg_id: str) -> bytes:
+        """Encoded b"ID*" for a segment id (cached)."""
+        prefix = self._prefixes.get(seg_id)
+        if prefix is None:
+            prefix = self._prefixes[seg_id] = seg_id.encode(self.encoding) + self._sep
+        return prefix
+
+    def join(self, seg_id: str, values: list[bytes]) -> bytes:
+        """Assemble a segment from already-encoded values: ID*v1*v2~"""
+        return self.prefix(seg_id) + self._sep.join(values) + self._term
+
+    def segment(self, seg_id: str, elements: list[Any]) -> bytes:
+        """Build one segment, sanitizing each element once."""
+        value = self.value
+        return self.prefix(seg_id) + self._sep.join([value(el) for el in elements]) + self._term
+
+
+@functools.lru_cache(maxsize=32)
+def get_encoder(
+    component: str = COMPONENT_SEPARATOR,
+    repetition: str = REPETITION_SEPARATOR,
+    element: str = ELEMENT_SEPARATOR,
+    terminator: str = SEGMENT_TERMINATOR,
+) -> X12Encoder:
+    """Shared X12Encoder for a delimiter set (built once per set)."""
+    return X12Encoder(element, component, repetition, terminator)
+
+
+def encoder_for_isa(_isa: dict) -> X12Encoder:
+    """Encoder honouring the repetition (ISA11) and component (ISA16) separators in ISA input."""
+    return get_encoder(
+        (_isa.get("ISA16") or COMPONENT_SEPARATOR)[:1],
+        (_isa.get("ISA11") or REPETITION_SEPARATOR)[:1],
+    )
+
+
+# ─── Compiled schema plan ─────────────────────────────────────────────────────
+
+class CompiledSegment(NamedTuple):
+    """One segment of a compiled loop: element ids and per-element value transforms."""
+    seg_id: str
+    el_ids: tuple[str, ...]
+    transforms: tuple[Callable[[Any], Any] | None, ...]
+
+
+class CompiledLoop(NamedTuple):
+    """One loop of a compiled schema; required holds (el_id, label) pairs in schema order."""
+    loop_id: str
+    repeatable: bool
+    segments: tuple[CompiledSegment, ...]
+    required: tuple[tuple[str, str], ...]
+
+
+# id(loops_schema) -> (loops_schema, plan); the schema is kept alive so its id is not reused.
+_PLAN_CACHE: dict[int, tuple[list, tuple[CompiledLoop, ...]]] = {}
+# Stored with plans cached on disk (edi_schemas); bump when compile_loops' output changes.
+PLAN_VERSION = 1
+
+
+def _element_transform(el_id: str) -> Callable[[Any], Any] | None:
+    """Value transform applied before sanitizing an element (DTP03 dates are reformatted)."""
+    if "03" in el_id and "DTP" in el_id:
+        return _format_date
+    return None
+
+
+def compile_loops(loops_schema: list) -> tuple[CompiledLoop, ...]:
+    """
+    Compile loop definitions (from get_loops) into an immutable execution plan.
+    Plans are cached per schema object; the schema must not be mutated after first use.
+    """
+    cached = _PLAN_CACHE.get(id(loops_schema))
+    if cached is not None and cached[0] is loops_schema:
+        return cached[1]
+    plan = []
+    for loop_def in loops_schema:
+        segments = []
+        required = []
+        for seg_def in loop_def.get("segments", []):
+            el_ids = tuple(el["id"] for el in seg_def.get("elements", []))
+            segments.append(CompiledSegment(
+                seg_def["seg_id"],
+                el_ids,
+                tuple(_element_transform(el_id) for el_id in el_ids),
+            ))
+            required.extend((el["id"], el["label"]) for el in seg_def.get("elements", []) if el.get("required"))
+        plan.append(CompiledLoop(
+            loop_def["loop_id"],
+            bool(loop_def.get("repeatable", False)),
+            tuple(segments),
+            tuple(required),
+        ))
+    plan = tuple(plan)
+    _PLAN_CACHE[id(loops_schema)] = (loops_schema, plan)
+    return plan
+
+
+def register_plan(loops_schema: list, plan: tuple[CompiledLoop, ...]):
+    """Use a plan compiled earlier (e.g. loaded from the schema cache) for loops_schema."""
+    _PLAN_CACHE[id(loops_schema)] = (loops_schema, plan)
+
+
+def _emit_segment(seg: CompiledSegment, item: dict, encoder: X12Encoder) -> bytes | None:
+    """Build one segment from a loop item; None when every element is empty."""
+    value = encoder.value
+    values = []
+    for el_id, transform in zip(seg.el_ids, seg.transforms):
+        val = item.get(el_id, "")
+        if transform is not None:
+            val = transform(val)
+        values.append(value(val))
+    if not any(values):
+        return None
+    return encoder.join(seg.seg_id, values)
+
+
+# Loops that must be present on every claim.
+_REQUIRED_LOOPS = ("1000A", "1000B", "2000A", "2000B", "2000C", "2300")
+# Header loops emitted once per transaction set (not per claim) in a batch.
+_HEADER_LOOPS = ("1000A", "1000B")
+
+
+def interchange_control(_isa: dict) -> InterchangeControl:
+    """Allocate control numbers for a new interchange (see edi_control); _isa["ISA13"] overrides ISA13."""
+    return get_allocator().interchange(_sanitize(_isa.get("ISA13")) or None)
+
+
+def envelope_control(_isa: dict) -> InterchangeControl:
+    """As interchange_control, without an ST02 (for writers numbering their own transaction sets)."""
+    return get_allocator().envelope(_sanitize(_isa.get("ISA13")) or None)
+
+
+def _isa_segment(_isa: dict, isa13: str, encoder: X12Encoder) -> bytes:
+    """
+    Build the fixed-width ISA interchange header from optional user overrides.
+    ISA11/ISA16 carry the encoder's repetition and component separators verbatim.
+    """
+    text = encoder.text
+    isa01 = (text(_isa.get("ISA01")) or "00").ljust(2)[:2]
+    isa02 = text(_isa.get("ISA02")).ljust(10)[:10]
+    isa03 = (text(_isa.get("ISA03")) or "00").ljust(2)[:2]
+    isa04 = text(_isa.get("ISA04")).ljust(10)[:10]
+    isa05 = (text(_isa.get("ISA05")) or "01").ljust(2)[:2]
+    isa06 = (text(_isa.get("ISA06")) or "SENDER").ljust(15)[:15]
+    isa07 = (text(_isa.get("ISA07")) or "01").ljust(2)[:2]
+    isa08 = (text(_isa.get("ISA08")) or "RECEIVER").ljust(15)[:15]
     isa09 = datetime.now().strftime("%y%m%d")
     isa10 = datetime.now().strftime("%H%M")
-    isa11 = _isa.get("ISA11") or REPETITION_SEPARATOR
-    isa12 = (_isa.get("ISA12") or "00501").ljust(5)[:5]
-    isa13 = (_isa.get("ISA13") or datetime.now().strftime("%y%m%d%H%M")[:9]).rjust(9)[-9:]
-    isa14 = (_isa.get("ISA14") or "0")[:1]
-    isa15 = (_isa.get("ISA15") or "T")[:1]
-    isa16 = (_isa.get("ISA16") or COMPONENT_SEPARATOR)[:1]
-    segments_out.append(_build_segment("ISA", [
+    isa11 = encoder.repetition
+    isa12 = (text(_isa.get("ISA12")) or "00501").ljust(5)[:5]
+    isa13 = isa13.rjust(9, "0")[-9:]
+    isa14 = (text(_isa.get("ISA14")) or "0")[:1]
+    isa15 = (text(_isa.get("ISA15")) or "T")[:1]
+    isa16 = encoder.component
+    fields = [
         isa01, isa02, isa03, isa04, isa05, isa06, isa07, isa08,
         isa09, isa10, isa11, isa12, isa13, isa14, isa15, isa16
-    ]))
+    ]
+    return encoder.join("ISA", [f.encode(encoder.encoding) for f in fields])
 
+
+def _group_header(claim_type: str, gs_id: str, encoder: X12Encoder) -> bytes:
+    """GS segment opening a functional group."""
     gs_date = datetime.now().strftime("%Y%m%d")
     gs_time = datetime.now().strftime("%H%M")
-    gs_id = "1"
     gs_ver = "005010X222A1" if claim_type.upper() == "837P" else "005010X223A2"
-    segments_out.append(_build_segment("GS", ["HC", "SENDER", "RECEIVER", gs_date, gs_time, gs_id, "X", gs_ver]))
+    return encoder.segment("GS", ["HC", "SENDER", "RECEIVER", gs_date, gs_time, gs_id, "X", gs_ver])
 
-    st_control = "0001"
-    segments_out.append(_build_segment("ST", ["837", st_control, "004010X098A1" if claim_type.upper() == "837P" else "004010X096A1"]))
-    segments_out.append(_build_segment("BHT", ["0019", "00", form_data.get("_BHT", {}).get("BHT03", "0000000001"), datetime.now().strftime("%Y%m%d"), datetime.now().strftime("%H%M"), "CH"]))
 
-    for loop_def in loops_schema:
-        loop_id = loop_def["loop_id"]
-        repeatable = loop_def.get("repeatable", False)
+def _interchange_header(claim_type: str, _isa: dict, isa13: str, gs_id: str, encoder: X12Encoder) -> list[bytes]:
+    """ISA and GS segments opening an interchange with one functional group."""
+    return [_isa_segment(_isa, isa13, encoder), _group_header(claim_type, gs_id, encoder)]
+
+
+def _transaction_header(claim_type: str, form_data: dict, st_control: str, encoder: X12Encoder) -> list[bytes]:
+    """ST and BHT segments opening one transaction set."""
+    return [
+        encoder.segment("ST", ["837", st_control, "004010X098A1" if claim_type.upper() == "837P" else "004010X096A1"]),
+        encoder.segment("BHT", ["0019", "00", form_data.get("_BHT", {}).get("BHT03", "0000000001"), datetime.now().strftime("%Y%m%d"), datetime.now().strftime("%H%M"), "CH"]),
+    ]
+
+
+def _group_trailer(st_count: int, gs_id: str, encoder: X12Encoder) -> bytes:
+    """GE segment closing a functional group of st_count transaction sets."""
+    return encoder.segment("GE", [str(st_count), gs_id])
+
+
+def _iea_segment(group_count: int, isa13: str, encoder: X12Encoder) -> bytes:
+    """IEA segment closing an interchange of group_count functional groups (IEA02 repeats ISA13)."""
+    return encoder.segment("IEA", [str(group_count), isa13])
+
+
+def _interchange_trailer(st_count: int, isa13: str, gs_id: str, encoder: X12Encoder) -> list[bytes]:
+    """GE and IEA segments closing an interchange with one functional group."""
+    return [_group_trailer(st_count, gs_id, encoder), _iea_segment(1, isa13, encoder)]
+
+
+def _claim_segments(
+    form_data: dict,
+    loops_schema: list,
+    errors: list,
+    encoder: X12Encoder,
+    skip_loops: tuple = (),
+    overrides: dict | None = None,
+    claim_index: int | None = None,
+    cache: "LoopSegmentCache | None" = None,
+) -> Iterator[bytes]:
+    """
+    Yield the loop segments of one claim, in schema order.
+    skip_loops: loop ids not emitted (e.g. 1000A/1000B after the first claim of a batch).
+    overrides: {loop_id: {el_id: value}} applied on top of the claim's values (HL renumbering).
+    cache: reuse the encoded segments of loop items whose values did not change (see LoopSegmentCache).
+    With an active StageTimer (edi_timing), each loop's build time is recorded.
+    """
+    timer = active_timer()
+    for loop in compile_loops(loops_schema):
+        loop_id = loop.loop_id
         loop_values = form_data.get(loop_id)
         if loop_values is None:
-            if loop_id in ("1000A", "1000B", "2000A", "2000B", "2000C", "2300"):
-                errors.append(f"Loop {loop_id} is required.")
+            if loop_id in _REQUIRED_LOOPS:
+                errors.append(ValidationIssue(claim_index, loop_id, "", None, RULE_REQUIRED_LOOP))
+            continue
+        if loop_id in skip_loops:
+            continue
+        items = loop_values if (loop.repeatable and isinstance(loop_values, list)) else ([loop_values] if loop_values else [])
+        loop_overrides = overrides.get(loop_id) if overrides else None
+        body = _loop_segments(loop, items, loop_overrides, encoder, cache)
+        if timer is None:
+            yield from body
+        else:
+            # Materialize the loop so its time excludes whatever the consumer does in between.
+            start = time.perf_counter()
+            body = list(body)
+            elapsed = time.perf_counter() - start
+            timer.add_loop(loop_id, elapsed)
+            timer.add("build", elapsed)
+            yield from body
+
+
+def _loop_segments(
+    loop: CompiledLoop, items: list, loop_overrides: dict | None, encoder: X12Encoder, cache: "LoopSegmentCache | None"
+) -> Iterator[bytes]:
+    """Yield the segments of each item of one loop."""
+    for item in items:
+        if not isinstance(item, dict):
             continue
-        items = loop_values if (repeatable and isinstance(loop_values, list)) else ([loop_values] if loop_values else [])
-
-        for item in items:
-            if not isinstance(item, dict):
-                continue
-            for seg_def in loop_def.get("segments", []):
-                seg_id = seg_def["seg_id"]
-                elements = []
-                for el_def in seg_def.get("elements", []):
-                    el_id = el_def["id"]
-                    val = item.get(el_id, "")
-                    if "03" in el_id and "DTP" in el_id:
-                        val = _format_date(val)
-                    elements.append(val)
-                if any(_sanitize(e) for e in elements):
-                    segments_out.append(_build_segment(seg_id, elements))
-
-    st_idx = next((i for i, s in enumerate(segments_out) if s.startswith("ST" + ELEMENT_SEPARATOR)), None)
-    if st_idx is not None:
-        se_count = len(segments_out) - st_idx + 1
-        segments_out.append(_build_segment("SE", [str(se_count), st_control]))
+        if loop_overrides:
+            item = {**item, **loop_overrides}
+        if cache is not None:
+            yield from cache.segments(loop, item, encoder)
+            continue
+        for seg in loop.segments:
+            segment = _emit_segment(seg, item, encoder)
+            if segment is not None:
+                yield segment
+
+
+def _batch_claim_segments(
+    claims: Iterable[dict], loops_schema: list, errors: list, encoder: X12Encoder
+) -> Iterator[bytes]:
+    """Yield the loop segments of every claim in a batch, renumbering HL segments."""
+    timer = active_timer()
+    hl_id = 0
+    billing_hl = None
+    prev_billing = None
+    for n, form_data in enumerate(claims):
+        if timer is None:
+            errors.extend(_validate_required(form_data, loops_schema, n))
+        else:
+            start = time.perf_counter()
+            errors.extend(_validate_required(form_data, loops_schema, n))
+            timer.add("validate", time.perf_counter() - start)
+        overrides = {}
+        billing = form_data.get("2000A")
+        if billing_hl is None or billing != prev_billing:
+            hl_id += 1
+            billing_hl = hl_id
+            prev_billing = billing
+            overrides["2000A"] = {"HL01": "0", "HL02": str(billing_hl)}
+            skip = () if n == 0 else _HEADER_LOOPS
+        else:
+            skip = _HEADER_LOOPS + ("2000A",)
+        hl_id += 1
+        subscriber_hl = hl_id
+        overrides["2000B"] = {"HL01": str(billing_hl), "HL02": str(subscriber_hl)}
+        hl_id += 1
+        overrides["2000C"] = {"HL01": str(subscriber_hl), "HL02": str(hl_id)}
+        yield from _claim_segments(form_data, loops_schema, errors, encoder, skip, overrides, n)
+
+
+class LoopSegmentCache:
+    """
+    Encoded segments of loop items keyed by the item's element values, for previews that
+    re-render a claim on every edit: only loops whose values changed are encoded again.
+    Least-recently-used entries beyond maxsize are dropped.
+    """
+
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def segments(self, loop: CompiledLoop, item: dict, encoder: X12Encoder) -> tuple[bytes, ...]:
+        get = item.get
+        key = (loop.loop_id, encoder, tuple(get(el_id) for seg in loop.segments for el_id in seg.el_ids))
+        entries = self._entries
+        cached = entries.get(key)
+        if cached is not None:
+            entries.move_to_end(key)
+            self.hits += 1
+            return cached
+        self.misses += 1
+        cached = tuple(
+            segment for segment in (_emit_segment(seg, item, encoder) for seg in loop.segments)
+            if segment is not None
+        )
+        entries[key] = cached
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+        return cached
+
+
+# Control numbers shown in previews (nothing is allocated until a file is written).
+_PREVIEW_CONTROL = InterchangeControl("000000000", "0", "0000")
+
+
+def build_edi_preview(
+    claim_type: str, form_data: dict, loops_schema: list, cache: LoopSegmentCache
+) -> tuple[str, list[ValidationIssue]]:
+    """
+    Build the EDI for one claim as build_edi_content does, but reusing cached loop segments and
+    without allocating control numbers (ISA13 is the _ISA override or zeros).
+    Returns (edi_string, validation_errors).
+    """
+    errors = _validate_required(form_data, loops_schema)
+    _isa = form_data.get("_ISA", form_data.get("ISA", {}))
+    encoder = encoder_for_isa(_isa)
+    # Padded here as the allocator pads it, so ISA13 and IEA02 carry the same nine digits.
+    isa13 = (_sanitize(_isa.get("ISA13")) or _PREVIEW_CONTROL.isa13).rjust(9, "0")[-9:]
+    st02 = _PREVIEW_CONTROL.st02
+    segments = _interchange_header(claim_type, _isa, isa13, _PREVIEW_CONTROL.gs06, encoder)
+    segments += _transaction_header(claim_type, form_data, st02, encoder)
+    body = list(_claim_segments(form_data, loops_schema, errors, encoder, cache=cache))
+    rules = get_rule_engine()
+    if rules is not None:
+        rule_pass = rules.start(errors, encoder, batch=False, plan=compile_loops(loops_schema))
+        rule_pass.scan(body)
+        rule_pass.finish()
+    segments.extend(body)
+    segments.append(encoder.segment("SE", [str(len(segments) - 1), st02]))
+    segments += _interchange_trailer(1, isa13, _PREVIEW_CONTROL.gs06, encoder)
+    return (b"".join(segments).decode(encoder.encoding), errors)
+
+
+def iter_transaction_set(
+    claim_type: str,
+    claims: Iterable[dict],
+    loops_schema: list,
+    errors: list,
+    st_control: str = "0001",
+    batch: bool = True,
+    encoder: X12Encoder | None = None,
+) -> Iterator[bytes]:
+    """
+    Yield the ST..SE segments of one transaction set as they are built (see iter_edi_segments).
+    The BHT reference is taken from the first claim's _BHT; encoder defaults to standard delimiters.
+    The edi_rules engine checks the segments in the same pass (unless EDI_RULES=0).
+    """
+    encoder = encoder or get_encoder()
+    claims = iter(claims)
+    first = next(claims, None)
+    if first is None:
+        raise ValueError("claims must contain at least one claim")
+    header = _transaction_header(claim_type, first, st_control, encoder)
+    yield from header
+    # ST through SE inclusive.
+    count = len(header) + 1
+
+    if batch:
+        body = _batch_claim_segments(itertools.chain((first,), claims), loops_schema, errors, encoder)
+    else:
+        with stage("validate"):
+            errors.extend(_validate_required(first, loops_schema))
+        body = _claim_segments(first, loops_schema, errors, encoder)
+    rules = get_rule_engine()
+    if rules is None:
+        for segment in body:
+            count += 1
+            yield segment
     else:
-        segments_out.append(_build_segment("SE", ["0", st_control]))
-    segments_out.append(_build_segment("GE", ["1", gs_id]))
-    segments_out.append(_build_segment("IEA", ["1", "000000001"]))
+        # Checked a chunk at a time as the chunk is passed on (one chunk for a single claim).
+        rule_pass = rules.start(errors, encoder, batch, compile_loops(loops_schema))
+        while chunk := list(itertools.islice(body, rules.CHUNK)):
+            rule_pass.scan(chunk)
+            count += len(chunk)
+            yield from chunk
+        rule_pass.finish()
+    yield encoder.segment("SE", [str(count), st_control])
+
+
+def iter_edi_segments(
+    claim_type: str,
+    claims: Iterable[dict],
+    loops_schema: list,
+    errors: list,
+    batch: bool = True,
+    encoder: X12Encoder | None = None,
+    control: InterchangeControl | None = None,
+) -> Iterator[bytes]:
+    """
+    Yield the encoded segments of one EDI 837 interchange (single ISA/GS/ST envelope) as they are built.
+    Claims are consumed lazily and the SE count is kept on the fly, so memory stays flat
+    regardless of batch size. Validation errors are appended to errors as claims are consumed.
+    batch=True: see build_edi_batch (HL renumbering, errors carry the claim index).
+    batch=False: claims holds exactly one claim, emitted as-is (as build_edi_content does).
+    encoder: defaults to the delimiters in the first claim's _ISA (ISA11/ISA16).
+    control: ISA13/GS06/ST02; allocated with interchange_control when omitted.
+    """
+    claims = iter(claims)
+    first = next(claims, None)
+    if first is None:
+        raise ValueError("claims must contain at least one claim")
+    _isa = first.get("_ISA", first.get("ISA", {}))
+    encoder = encoder or encoder_for_isa(_isa)
+    control = control or interchange_control(_isa)
+    yield from _interchange_header(claim_type, _isa, control.isa13, control.gs06, encoder)
+    yield from iter_transaction_set(
+        claim_type, itertools.chain((first,), claims), loops_schema, errors, control.st02, batch, encoder
+    )
+    yield from _interchange_trailer(1, control.isa13, control.gs06, encoder)
+
+
+# Flush threshold for write_edi's reusable output buffer.
+_WRITE_BUFFER_SIZE = 64 * 1024
+
+
+def write_edi(
+    fp: BinaryIO,
+    claim_type: str,
+    claims: Iterable[dict],
+    loops_schema: list,
+    batch: bool = True,
+    encoder: X12Encoder | None = None,
+    control: InterchangeControl | None = None,
+) -> tuple[int, list[ValidationIssue]]:
+    """
+    Stream one EDI 837 interchange into a binary file object (see iter_edi_segments).
+    Segments are gathered in one reusable buffer and written in large blocks.
+    Returns (bytes_written, validation_errors).
+    """
+    errors = []
+    written = 0
+    timer = active_timer()
+
+    def _timed_write(data):
+        with timer.stage("write"):
+            fp.write(data)
+
+    write = _timed_write if timer is not None else fp.write
+    buf = bytearray()
+    for segment in iter_edi_segments(claim_type, claims, loops_schema, errors, batch, encoder, control):
+        buf += segment
+        if len(buf) >= _WRITE_BUFFER_SIZE:
+            write(buf)
+            written += len(buf)
+            buf.clear()
+    write(buf)
+    written += len(buf)
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.record_validation_errors(claim_type, errors)
+    return (written, errors)
+
+
+def build_edi_content(claim_type: str, form_data: dict, loops_schema: list) -> tuple[str, list[ValidationIssue]]:
+    """
+    Build full EDI 837 (with ISA/GS/ST envelope) from form data.
+    Returns (edi_string, validation_errors).
+    """
+    errors = []
+    edi = b"".join(iter_edi_segments(claim_type, (form_data,), loops_schema, errors, batch=False))
+    return (edi.decode("utf-8"), errors)
 
-    return (SEGMENT_TERMINATOR.join(segments_out), errors)
+
+def build_edi_batch(claim_type: str, claims: Iterable[dict], loops_schema: list) -> tuple[str, list[ValidationIssue]]:
+    """
+    Build one EDI 837 interchange (single ISA/GS/ST envelope) holding many claims.
+    The envelope (_ISA, _BHT) and the 1000A/1000B header loops are taken from the first claim.
+    HL segments are renumbered across the batch: consecutive claims with the same 2000A
+    billing provider share one billing provider HL; each claim gets its own subscriber
+    (2000B) and patient (2000C) HL. Per the schema, HL01 is the parent ID and HL02 the ID.
+    Returns (edi_string, validation_errors); each ValidationIssue carries its 0-based claim_index.
+    For large batches prefer write_edi, which streams to a file instead of building a string.
+    """
+    errors = []
+    edi = b"".join(iter_edi_segments(claim_type, claims, loops_schema, errors))
+    return (edi.decode("utf-8"), errors)
 
 
 def recount_se_and_fix(edi: str) -> str:
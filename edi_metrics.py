@@ -0,0 +1,286 @@
+"""
+In-process runtime metrics for batch and service deployments: counters and histograms of
+claims generated, validation failures by loop/element, bytes written, OpenAI latency and token
+usage, and cache hits. Off unless EDI_METRICS=1 (or enable_metrics() is called); when off,
+get_metrics() returns None and instrumented code skips recording entirely.
+The registry renders OpenMetrics text, served by serve_metrics() on a local HTTP endpoint
+and/or written to a file periodically by flush_metrics_every().
+"""
+import atexit
+import bisect
+import os
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+METRICS_ENABLED = os.getenv("EDI_METRICS", "0").lower() in ("1", "true", "yes")
+# With EDI_METRICS on, these start the exporters when the registry is first used.
+METRICS_PORT = int(os.getenv("EDI_METRICS_PORT", 0)) or None
+METRICS_FILE = os.getenv("EDI_METRICS_FILE") or None
+METRICS_FLUSH_INTERVAL = float(os.getenv("EDI_METRICS_FLUSH_INTERVAL", 15))
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """Monotonic counter per label set; inc(amount, **labels)."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels.get(n, "") for n in self.labels), 0)
+
+    def take(self) -> dict:
+        """Values recorded since the last take(), cleared (for handing to another process)."""
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values: dict):
+        """Add values returned by another process's take()."""
+        with self._lock:
+            for key, amount in values.items():
+                self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}_total{_labels(self.labels, key)} {_number(v)}" for key, v in values]
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set; observe(value, **labels)."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, the +Inf bucket last, then the sum.
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def take(self) -> dict:
+        """Per-bucket states recorded since the last take(), cleared."""
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values: dict):
+        """Add per-bucket states returned by another process's take() (same buckets)."""
+        with self._lock:
+            for key, other in values.items():
+                state = self._values.get(key)
+                if state is None:
+                    self._values[key] = list(other)
+                else:
+                    for i, count in enumerate(other):
+                        state[i] += count
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = sorted((key, list(state)) for key, state in self._values.items())
+        lines = []
+        for key, state in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                labels = _labels(self.labels, key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(state[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """Named counters and histograms, rendered together as one OpenMetrics exposition."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def take(self) -> dict:
+        """{metric name: values} recorded since the last take(), cleared; see merge()."""
+        return {name: values for name, metric in list(self._metrics.items()) if (values := metric.take())}
+
+    def merge(self, taken: dict):
+        """Fold in what take() returned in another process (e.g. a pool worker); unknown names are ignored."""
+        for name, values in taken.items():
+            metric = self._metrics.get(name)
+            if metric is not None:
+                metric.merge(values)
+
+    def render(self) -> str:
+        """OpenMetrics text exposition (ends with "# EOF")."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.append(f"# HELP {metric.name} {_escape(metric.help)}")
+            lines.extend(metric.samples())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+class Metrics(MetricsRegistry):
+    """The generator's instruments (see the README for their labels)."""
+
+    def __init__(self):
+        super().__init__()
+        self.claims = self.counter(
+            "edi_claims_generated", "Claims written to EDI files.", ("claim_type", "path"))
+        self.files = self.counter(
+            "edi_files_written", "EDI files committed by the output sink.", ("claim_type", "path"))
+        self.bytes = self.counter(
+            "edi_bytes_written", "Bytes of EDI written.", ("claim_type", "path"))
+        self.validation_failures = self.counter(
+            "edi_validation_failures", "Validation issues found during generation.",
+            ("claim_type", "rule", "loop_id", "element_id"))
+        self.generation_seconds = self.histogram(
+            "edi_generation_seconds", "End-to-end generate_837 latency.", ("claim_type", "strategy"))
+        self.llm_seconds = self.histogram(
+            "edi_llm_request_seconds", "OpenAI request latency (whole stream when streaming).", ("model", "outcome"))
+        self.llm_tokens = self.counter(
+            "edi_llm_tokens", "OpenAI tokens reported in response usage.", ("model", "kind"))
+        self.cache = self.counter(
+            "edi_cache_requests", "OpenAI response cache lookups.", ("result",))
+        self.service_seconds = self.histogram(
+            "edi_service_request_seconds", "Generation service latency, queueing included.", ("claim_type", "output"))
+        self.service_batch_size = self.histogram(
+            "edi_service_batch_size", "Claims per micro-batch sent to the service's worker pool.", (),
+            (1, 2, 4, 8, 16, 32, 64, 128, 256))
+
+    def record_validation_errors(self, claim_type: str, issues: Iterable):
+        """Count ValidationIssue records by rule, loop and element (element "" for whole-loop rules)."""
+        inc = self.validation_failures.inc
+        for issue in issues:
+            inc(claim_type=claim_type, rule=issue.rule, loop_id=issue.loop_id, element_id=issue.element_id)
+
+
+# ─── Exporters ────────────────────────────────────────────────────────────────
+
+def serve_metrics(registry: MetricsRegistry, port: int = 9464, host: str = "127.0.0.1") -> "ThreadingHTTPServer":
+    """Serve registry as OpenMetrics text on http://host:port/metrics from a daemon thread."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="edi-metrics-http", daemon=True).start()
+    return server
+
+
+def write_metrics(registry: MetricsRegistry, path: str | Path):
+    """Write the exposition to path atomically (temp file + rename), for textfile collectors."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(registry.render(), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def flush_metrics_every(registry: MetricsRegistry, path: str | Path, interval: float = METRICS_FLUSH_INTERVAL) -> threading.Event:
+    """Write registry to path every interval seconds and at exit; set the returned event to stop."""
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            write_metrics(registry, path)
+
+    threading.Thread(target=run, name="edi-metrics-flush", daemon=True).start()
+    atexit.register(lambda: stop.is_set() or write_metrics(registry, path))
+    return stop
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def enable_metrics(port: int | None = METRICS_PORT, path: str | Path | None = METRICS_FILE) -> Metrics:
+    """Turn recording on (once per process); optionally serve on port and/or flush to path."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+            if port:
+                serve_metrics(_metrics, port)
+            if path:
+                flush_metrics_every(_metrics, path)
+        return _metrics
+
+
+def get_metrics() -> Metrics | None:
+    """The process-wide Metrics, or None when metrics are disabled (the common, free case)."""
+    if _metrics is None and METRICS_ENABLED:
+        return enable_metrics()
+    return _metrics
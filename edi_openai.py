@@ -1,23 +1,28 @@
 """
 Generate 837 EDI file via OpenAI: UI data → JSON template → API → EDI file.
+The sync and async paths each reuse one long-lived client (and its HTTP connection pool).
+Set OPENAI_BASE_URL to point them at a compatible server (e.g. benchmarks/stub_openai_server.py).
 """
+import asyncio
+import functools
 import json
 import os
 import re
+import time
 from pathlib import Path
-from datetime import datetime
+from typing import AsyncIterator, Callable, Iterable
 
-# Load .env from project root (parent of EDI_File_Generator)
-try:
-    from dotenv import load_dotenv
-    _env_path = Path(__file__).resolve().parent.parent / ".env"
-    load_dotenv(_env_path)
-except ImportError:
-    pass
+from .edi_cache import ResponseCache, cache_key
+from .edi_metrics import get_metrics
+from .edi_sink import get_output_sink
+from .edi_timing import active_timer, stage, timing
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
-EDI_OUTPUT_DIR = Path(__file__).resolve().parent / "edi_output"
-EDI_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+OPENAI_MODEL = "gpt-4o-mini"
+# Response cache: EDI_OPENAI_CACHE=0 disables it; EDI_OPENAI_CACHE_DIR moves it.
+OPENAI_CACHE_ENABLED = os.getenv("EDI_OPENAI_CACHE", "1").lower() not in ("0", "false", "no")
+OPENAI_CACHE_DIR = Path(os.getenv("EDI_OPENAI_CACHE_DIR") or Path(__file__).parent / ".cache" / "openai")
+# Loaded (if python-dotenv is installed) on first use, not at import.
+ENV_FILE = Path(__file__).parent.parent / ".env"
 
 SYSTEM_MESSAGE = (
     "You are a helpful assistant and an expert on claims to generate an 837 file. "
@@ -27,6 +32,18 @@ SYSTEM_MESSAGE = (
 )
 
 
+@functools.lru_cache(maxsize=None)
+def openai_settings() -> tuple[str, str | None]:
+    """(OPENAI_API_KEY, OPENAI_BASE_URL), read on first use after loading ENV_FILE into the environment."""
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        pass
+    else:
+        load_dotenv(ENV_FILE)
+    return os.getenv("OPENAI_API_KEY", ""), os.getenv("OPENAI_BASE_URL") or None
+
+
 def build_claim_json(form_data: dict, claim_type: str) -> dict:
     """
     Build a JSON template with all elements from the UI form data.
@@ -56,14 +73,98 @@ def _extract_edi_from_response(text: str) -> str:
     return text
 
 
-def generate_837_via_openai(claim_type: str, claim_json: dict) -> dict:
+# Streaming: abort when no ISA appears within this many characters of (fence-stripped) output.
+STREAM_ISA_WINDOW = 256
+_SEGMENT_ID = re.compile(r"[A-Z][A-Z0-9]{1,2}")
+_ISA_START = re.compile(r"ISA[^A-Za-z0-9\s]")
+_ISA_LENGTH = 106
+
+
+class EdiStreamAborted(Exception):
+    """Streamed completion is clearly not X12; the request should be cancelled."""
+
+
+class EdiStreamParser:
     """
-    Send claim JSON to OpenAI with system message; save returned EDI to file.
-    claim_type: "837P" or "837I"
-    claim_json: from build_claim_json(form_data, claim_type)
-    Returns: { "success", "file_path", "file_name", "errors", "message" }
+    Incremental segment tokenizer for a streamed completion.
+    feed() returns the segments completed by each text delta (terminator included) and raises
+    EdiStreamAborted as soon as the output is clearly not X12: no ISA within STREAM_ISA_WINDOW
+    characters, or a segment whose ID is not 2-3 uppercase letters/digits. Text before the ISA
+    (e.g. a markdown fence) is dropped; a closing fence ends the EDI.
     """
-    claim_type = claim_type.upper().strip()
+
+    def __init__(self, isa_window: int = STREAM_ISA_WINDOW):
+        self.isa_window = isa_window
+        self.terminator = None
+        self.element = None
+        self.done = False
+        self._buf = ""
+
+    def _find_header(self) -> bool:
+        """Locate ISA (any preamble or fence before it is dropped) and learn the delimiters."""
+        m = _ISA_START.search(self._buf)
+        if m is None or m.start() > self.isa_window:
+            if m is not None or len(self._buf) > self.isa_window:
+                raise EdiStreamAborted(f"No ISA segment in the first {self.isa_window} characters.")
+            return False
+        buf = self._buf = self._buf[m.start():]
+        # buf[3] is the separator before ISA01; ISA16 follows the 16th one, then the terminator.
+        element = buf[3]
+        pos = 3
+        for _ in range(15):
+            pos = buf.find(element, pos + 1)
+            if pos < 0:
+                break
+        if pos < 0 or len(buf) < pos + 3:
+            if len(buf) > 2 * _ISA_LENGTH:
+                raise EdiStreamAborted("ISA segment is malformed.")
+            return False
+        terminator = buf[pos + 2]
+        if terminator.isalnum() or terminator == element:
+            raise EdiStreamAborted("ISA segment is malformed.")
+        self.element = element
+        self.terminator = terminator
+        return True
+
+    def feed(self, text: str) -> list[str]:
+        if self.done or not text:
+            return []
+        self._buf += text
+        if self.terminator is None and not self._find_header():
+            return []
+        segments = []
+        *complete, self._buf = self._buf.split(self.terminator)
+        for raw in complete:
+            segment = raw.strip()
+            if segment.startswith("```"):
+                self.done = True
+                self._buf = ""
+                break
+            seg_id = segment.split(self.element, 1)[0]
+            if not _SEGMENT_ID.fullmatch(seg_id):
+                raise EdiStreamAborted(f"Malformed segment ID: {seg_id[:20]!r}")
+            segments.append(segment + self.terminator)
+        if "```" in self._buf:
+            self.done = True
+        return segments
+
+    def close(self) -> list[str]:
+        """Flush at end of stream: trailing text without a terminator is kept as a last segment."""
+        if self.terminator is None:
+            raise EdiStreamAborted("Output does not contain an ISA segment.")
+        tail = self._buf.split("```", 1)[0].strip()
+        self._buf = ""
+        self.done = True
+        if not tail:
+            return []
+        seg_id = tail.split(self.element, 1)[0]
+        if not _SEGMENT_ID.fullmatch(seg_id):
+            raise EdiStreamAborted(f"Malformed segment ID: {seg_id[:20]!r}")
+        return [tail]
+
+
+def _check_request(claim_type: str) -> dict | None:
+    """Error result for an invalid claim type or missing API key; None when the request can be sent."""
     if claim_type not in ("837P", "837I"):
         return {
             "success": False,
@@ -72,8 +173,7 @@ def generate_837_via_openai(claim_type: str, claim_json: dict) -> dict:
             "errors": [f"Invalid claim type: {claim_type}. Use 837P or 837I."],
             "message": "Invalid claim type.",
         }
-
-    if not OPENAI_API_KEY:
+    if not openai_settings()[0]:
         return {
             "success": False,
             "file_path": None,
@@ -81,34 +181,33 @@ def generate_837_via_openai(claim_type: str, claim_json: dict) -> dict:
             "errors": ["OPENAI_API_KEY is not set. Add it to your .env file."],
             "message": "OpenAI API key is missing.",
         }
+    return None
 
+
+def _build_messages(claim_type: str, claim_json: dict) -> list[dict]:
     user_content = (
         f"Generate a valid HIPAA 5010 {claim_type} EDI file from the following claim data. "
         "Output only the raw EDI content (ISA through IEA), no explanation.\n\n"
         + json.dumps(claim_json, indent=2)
     )
+    return [
+        {"role": "system", "content": SYSTEM_MESSAGE},
+        {"role": "user", "content": user_content},
+    ]
+
+
+def _api_error(e: Exception) -> dict:
+    return {
+        "success": False,
+        "file_path": None,
+        "file_name": None,
+        "errors": [str(e)],
+        "message": f"OpenAI API error: {e}",
+    }
 
-    try:
-        from openai import OpenAI
-        client = OpenAI(api_key=OPENAI_API_KEY)
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": SYSTEM_MESSAGE},
-                {"role": "user", "content": user_content},
-            ],
-            temperature=0.2,
-        )
-        content = response.choices[0].message.content or ""
-    except Exception as e:
-        return {
-            "success": False,
-            "file_path": None,
-            "file_name": None,
-            "errors": [str(e)],
-            "message": f"OpenAI API error: {e}",
-        }
 
+def _save_response(claim_type: str, content: str) -> dict:
+    """Extract EDI from the completion text and save it to edi_output."""
     edi_content = _extract_edi_from_response(content)
     if not edi_content or "ISA" not in edi_content:
         return {
@@ -119,25 +218,330 @@ def generate_837_via_openai(claim_type: str, claim_json: dict) -> dict:
             "message": "Invalid or empty EDI content from API.",
         }
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    file_name = f"{claim_type}_{timestamp}.edi"
-    file_path = EDI_OUTPUT_DIR / file_name
-
+    data = edi_content.encode("utf-8")
     try:
-        file_path.write_text(edi_content, encoding="utf-8")
+        file_path = get_output_sink().write(claim_type, data)
     except Exception as e:
         return {
             "success": False,
             "file_path": None,
-            "file_name": file_name,
+            "file_name": None,
             "errors": [f"Failed to write file: {e}"],
             "message": f"File could not be saved: {e}",
         }
 
+    _record_file(claim_type, len(data))
     return {
         "success": True,
         "file_path": str(file_path),
-        "file_name": file_name,
+        "file_name": file_path.name,
         "errors": [],
-        "message": f"EDI file generated via OpenAI: {file_name}",
+        "message": f"EDI file generated via OpenAI: {file_path.name}",
     }
+
+
+_client = None
+# AsyncOpenAI clients by event loop: a client's connections belong to the loop that opened them.
+_async_clients = {}
+_response_cache = None
+
+
+def get_response_cache() -> ResponseCache | None:
+    """Shared on-disk response cache, or None when disabled (see ResponseCache.stats for hit rate)."""
+    global _response_cache
+    if not OPENAI_CACHE_ENABLED:
+        return None
+    if _response_cache is None:
+        _response_cache = ResponseCache(OPENAI_CACHE_DIR)
+    return _response_cache
+
+
+def _record_file(claim_type: str, size: int):
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.claims.inc(claim_type=claim_type, path="llm")
+        metrics.files.inc(claim_type=claim_type, path="llm")
+        metrics.bytes.inc(size, claim_type=claim_type, path="llm")
+
+
+def _record_request(seconds: float, outcome: str, usage=None):
+    """Record one OpenAI request (outcome "ok", "error" or "aborted") and its token usage."""
+    metrics = get_metrics()
+    if metrics is None:
+        return
+    metrics.llm_seconds.observe(seconds, model=OPENAI_MODEL, outcome=outcome)
+    if usage is not None:
+        metrics.llm_tokens.inc(getattr(usage, "prompt_tokens", 0) or 0, model=OPENAI_MODEL, kind="prompt")
+        metrics.llm_tokens.inc(getattr(usage, "completion_tokens", 0) or 0, model=OPENAI_MODEL, kind="completion")
+
+
+def _cached_result(claim_type: str, key: str | None) -> dict | None:
+    """Saved result for a cached response, or None on a miss."""
+    cache = get_response_cache()
+    content = cache.get(key) if cache and key else None
+    if cache and key:
+        metrics = get_metrics()
+        if metrics is not None:
+            metrics.cache.inc(result="miss" if content is None else "hit")
+    if content is None:
+        return None
+    result = _save_response(claim_type, content)
+    result["cached"] = True
+    if result["success"]:
+        result["message"] += " (cached)"
+    return result
+
+
+def _store_result(key: str | None, content: str, result: dict) -> dict:
+    """Cache the response text of a successful generation."""
+    cache = get_response_cache()
+    if cache and key and result["success"]:
+        cache.put(key, content)
+    result["cached"] = False
+    return result
+
+
+def _get_client():
+    """Long-lived OpenAI client shared by all synchronous calls."""
+    global _client
+    if _client is None:
+        from openai import OpenAI
+        api_key, base_url = openai_settings()
+        _client = OpenAI(api_key=api_key, base_url=base_url)
+    return _client
+
+
+def _get_async_client():
+    """
+    Long-lived AsyncOpenAI client of the running event loop, shared by the async calls on it.
+    Each loop gets its own (a client used on another loop fails); clients of closed loops are dropped.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        from openai import AsyncOpenAI
+        api_key, base_url = openai_settings()
+        for other in [other for other in _async_clients if other.is_closed()]:
+            del _async_clients[other]
+        client = _async_clients[loop] = AsyncOpenAI(api_key=api_key, base_url=base_url)
+    return client
+
+
+def _generate_streaming(
+    claim_type: str, claim_json: dict, key: str | None, on_segment: Callable[[str], None] | None
+) -> dict:
+    """
+    Stream the completion, writing each segment to the output file as it arrives (and passing it
+    to on_segment). The request is closed as soon as EdiStreamParser decides the output is not X12.
+    """
+    parser = EdiStreamParser()
+    parts = []
+    stream = None
+    usage = None
+    timer = active_timer()
+    # Token usage arrives in a final chunk only when asked for; only ask when it is recorded.
+    extra = {"stream_options": {"include_usage": True}} if get_metrics() is not None else {}
+    start = time.perf_counter()
+
+    written = 0
+
+    def emit(out, segments: list[str]):
+        nonlocal written
+        for segment in segments:
+            if not parts and timer is not None:
+                timer.add("first_segment", time.perf_counter() - start)
+            data = segment.encode("utf-8")
+            out.fp.write(data)
+            written += len(data)
+            parts.append(segment)
+            if on_segment is not None:
+                on_segment(segment)
+
+    try:
+        # The sink deletes its temporary file if the stream is aborted or fails.
+        with stage("api"), get_output_sink().open(claim_type) as out:
+            stream = _get_client().chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=_build_messages(claim_type, claim_json),
+                temperature=0.2,
+                stream=True,
+                **extra,
+            )
+            for chunk in stream:
+                usage = getattr(chunk, "usage", None) or usage
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    emit(out, parser.feed(delta))
+                if parser.done:
+                    break
+            emit(out, parser.close())
+    except EdiStreamAborted as e:
+        _record_request(time.perf_counter() - start, "aborted", usage)
+        return {
+            "success": False,
+            "file_path": None,
+            "file_name": None,
+            "errors": [f"OpenAI output is not valid EDI: {e}"],
+            "message": "Aborted: OpenAI did not return EDI content.",
+        }
+    except Exception as e:
+        _record_request(time.perf_counter() - start, "error", usage)
+        if parts:
+            return {
+                "success": False,
+                "file_path": None,
+                "file_name": None,
+                "errors": [f"Failed while streaming EDI: {e}"],
+                "message": f"File could not be saved: {e}",
+            }
+        return _api_error(e)
+    finally:
+        if stream is not None:
+            stream.close()
+
+    _record_request(time.perf_counter() - start, "ok", usage)
+    _record_file(claim_type, written)
+    with stage("cache_store"):
+        return _store_result(key, "".join(parts), {
+            "success": True,
+            "file_path": str(out.path),
+            "file_name": out.name,
+            "errors": [],
+            "message": f"EDI file generated via OpenAI: {out.name}",
+        })
+
+
+def generate_837_via_openai(
+    claim_type: str,
+    claim_json: dict,
+    use_cache: bool = True,
+    stream: bool = False,
+    on_segment: Callable[[str], None] | None = None,
+    timings: bool | None = None,
+) -> dict:
+    """
+    Send claim JSON to OpenAI with system message; save returned EDI to file.
+    claim_type: "837P" or "837I"
+    claim_json: from build_claim_json(form_data, claim_type)
+    use_cache: answer identical requests from the on-disk response cache.
+    stream: consume the completion as a stream, writing segments to the file as they arrive and
+        aborting early when the output is not X12 (see EdiStreamParser); on_segment, if given,
+        receives each segment (implies stream).
+    timings: add "timings" (cache_lookup, api, first_segment, save, cache_store; see edi_timing).
+    Returns: { "success", "file_path", "file_name", "errors", "message", "cached" }
+    """
+    with timing(timings) as timer:
+        result = _generate_via_openai(claim_type, claim_json, use_cache, stream, on_segment)
+    if timer is not None:
+        result["timings"] = timer.as_dict()
+    return result
+
+
+def _generate_via_openai(
+    claim_type: str, claim_json: dict, use_cache: bool, stream: bool, on_segment: Callable[[str], None] | None
+) -> dict:
+    claim_type = claim_type.upper().strip()
+    error = _check_request(claim_type)
+    if error:
+        return error
+
+    key = cache_key(claim_type, claim_json, OPENAI_MODEL, SYSTEM_MESSAGE) if use_cache else None
+    with stage("cache_lookup"):
+        result = _cached_result(claim_type, key)
+    if result is not None:
+        return result
+
+    if stream or on_segment is not None:
+        return _generate_streaming(claim_type, claim_json, key, on_segment)
+
+    start = time.perf_counter()
+    try:
+        with stage("api"):
+            response = _get_client().chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=_build_messages(claim_type, claim_json),
+                temperature=0.2,
+            )
+        content = response.choices[0].message.content or ""
+    except Exception as e:
+        _record_request(time.perf_counter() - start, "error")
+        return _api_error(e)
+    _record_request(time.perf_counter() - start, "ok", getattr(response, "usage", None))
+
+    with stage("save"):
+        result = _save_response(claim_type, content)
+    with stage("cache_store"):
+        return _store_result(key, content, result)
+
+
+async def generate_837_via_openai_async(claim_type: str, claim_json: dict, client=None, use_cache: bool = True) -> dict:
+    """
+    Async variant of generate_837_via_openai using the shared AsyncOpenAI client (or client).
+    Returns the same result dict.
+    """
+    claim_type = claim_type.upper().strip()
+    error = _check_request(claim_type)
+    if error:
+        return error
+
+    key = cache_key(claim_type, claim_json, OPENAI_MODEL, SYSTEM_MESSAGE) if use_cache else None
+    result = await asyncio.to_thread(_cached_result, claim_type, key)
+    if result is not None:
+        return result
+
+    start = time.perf_counter()
+    try:
+        response = await (client or _get_async_client()).chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=_build_messages(claim_type, claim_json),
+            temperature=0.2,
+        )
+        content = response.choices[0].message.content or ""
+    except Exception as e:
+        _record_request(time.perf_counter() - start, "error")
+        return _api_error(e)
+    _record_request(time.perf_counter() - start, "ok", getattr(response, "usage", None))
+
+    # File and cache writes are blocking; keep them off the event loop.
+    result = await asyncio.to_thread(_save_response, claim_type, content)
+    return await asyncio.to_thread(_store_result, key, content, result)
+
+
+async def generate_837_batch_via_openai_async(
+    claim_type: str,
+    claim_jsons: Iterable[dict],
+    max_concurrency: int = 8,
+    requests_per_second: float | None = None,
+    client=None,
+    use_cache: bool = True,
+) -> AsyncIterator[tuple[int, dict]]:
+    """
+    Generate many claims concurrently over one client, yielding (index, result) as each completes.
+    At most max_concurrency requests are in flight; requests_per_second (optional) spaces out
+    request starts to stay under an API rate limit.
+    """
+    client = client or _get_async_client()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    interval = 1.0 / requests_per_second if requests_per_second else 0.0
+    pace_lock = asyncio.Lock()
+    next_start = 0.0
+
+    async def run(index: int, claim_json: dict) -> tuple[int, dict]:
+        nonlocal next_start
+        async with semaphore:
+            if interval:
+                async with pace_lock:
+                    now = time.monotonic()
+                    wait = next_start - now
+                    next_start = max(now, next_start) + interval
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            return index, await generate_837_via_openai_async(claim_type, claim_json, client, use_cache)
+
+    tasks = [asyncio.create_task(run(i, cj)) for i, cj in enumerate(claim_jsons)]
+    try:
+        for done in asyncio.as_completed(tasks):
+            yield await done
+    finally:
+        for task in tasks:
+            task.cancel()
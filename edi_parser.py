@@ -0,0 +1,225 @@
+"""
+Streaming X12 837 reader.
+Memory-maps an .edi file, detects the delimiters from the fixed-width ISA header and yields
+segments (and 837 loops) lazily with their byte offsets, so files of any size are read with
+constant memory. Also used on in-memory EDI (bytes or str) via parse_edi.
+"""
+import mmap
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, NamedTuple
+
+# ISA is fixed width: element separator at 3, ISA11 repetition at 82, ISA16 component at 104,
+# segment terminator at 105.
+ISA_LENGTH = 106
+_WHITESPACE = b" \t\r\n"
+# Bytes split per step by iter_segments.
+_BLOCK_SIZE = 1 << 20
+
+# Segments outside the claim loops.
+_HEADER_SEGMENTS = frozenset(("ISA", "GS", "ST", "BHT"))
+_TRAILER_SEGMENTS = frozenset(("SE", "GE", "IEA"))
+# Loop-opening segments: (seg_id, first element) -> loop_id; None matches any first element.
+_NM1_LOOPS = {"41": "1000A", "40": "1000B"}
+_HL_LOOPS = {"20": "2000A", "22": "2000B", "23": "2000C"}
+
+
+class EdiParseError(ValueError):
+    """The data is not an X12 interchange (or its ISA header is malformed)."""
+
+
+class Delimiters(NamedTuple):
+    element: bytes
+    component: bytes
+    repetition: bytes
+    terminator: bytes
+
+
+class Segment(NamedTuple):
+    """One segment; raw excludes the terminator, offset/end are byte positions in the source."""
+    seg_id: str
+    raw: bytes
+    offset: int
+    end: int
+    delimiters: Delimiters
+
+    def elements(self, encoding: str = "utf-8") -> list[str]:
+        """Decoded elements; index 0 is the segment ID, so elements()[3] is e.g. NM103."""
+        return self.raw.decode(encoding).split(self.delimiters.element.decode(encoding))
+
+    def element(self, position: int, default: str = "") -> str:
+        """Element at position (1-based, as in NM103 -> 3), or default when absent."""
+        parts = self.raw.split(self.delimiters.element, position + 1)
+        if position < len(parts):
+            return parts[position].decode("utf-8")
+        return default
+
+    def text(self, encoding: str = "utf-8") -> str:
+        """The segment as written, with its terminator."""
+        return (self.raw + self.delimiters.terminator).decode(encoding)
+
+
+class Loop(NamedTuple):
+    """Consecutive segments of one 837 loop (or "HEADER"/"TRAILER" for envelope segments)."""
+    loop_id: str
+    segments: list[Segment]
+
+    @property
+    def offset(self) -> int:
+        return self.segments[0].offset
+
+    @property
+    def end(self) -> int:
+        return self.segments[-1].end
+
+
+def detect_delimiters(data) -> Delimiters:
+    """Read the delimiters from the ISA header at the start of data (leading whitespace allowed)."""
+    start = 0
+    while start < len(data) and data[start:start + 1] in (b" ", b"\t", b"\r", b"\n"):
+        start += 1
+    header = bytes(data[start:start + ISA_LENGTH])
+    if not header.startswith(b"ISA"):
+        raise EdiParseError("Data does not start with an ISA segment.")
+    if len(header) < ISA_LENGTH:
+        raise EdiParseError(f"ISA segment is shorter than {ISA_LENGTH} characters.")
+    element = header[3:4]
+    if header.count(element) != 16 or header[103:104] != element:
+        raise EdiParseError("ISA segment is not fixed width (expected 16 element separators, ISA16 at 104).")
+    delimiters = Delimiters(element, header[104:105], header[82:83], header[105:106])
+    if delimiters.terminator.isalnum() or delimiters.terminator == element:
+        raise EdiParseError(f"Invalid segment terminator {delimiters.terminator!r}.")
+    return delimiters
+
+
+def iter_segments(data, delimiters: Delimiters | None = None, start: int = 0) -> Iterator[Segment]:
+    """
+    Yield segments from data (bytes, bytearray, memoryview or mmap) starting at byte start.
+    Whitespace between segments (e.g. one segment per line) is skipped; a trailing segment
+    without a terminator is still yielded. Data is split a block at a time, so an mmap is
+    never copied whole.
+    """
+    if delimiters is None:
+        delimiters = detect_delimiters(data[start:start + ISA_LENGTH + 16])
+    terminator = delimiters.terminator
+    element = delimiters.element
+    size = len(data)
+    pos = start
+    while pos < size:
+        block_end = min(pos + _BLOCK_SIZE, size)
+        if block_end < size:
+            # Cut the block after its last terminator (or extend it to the next one).
+            cut = data.rfind(terminator, pos, block_end)
+            if cut < 0:
+                cut = data.find(terminator, block_end)
+            block_end = size if cut < 0 else cut + 1
+        pieces = data[pos:block_end].split(terminator)
+        if block_end < size or not pieces[-1]:
+            pieces.pop()
+        offset = pos
+        for raw in pieces:
+            next_offset = offset + len(raw) + 1
+            seg = raw.strip(_WHITESPACE)
+            if seg:
+                if len(seg) != len(raw):
+                    offset += len(raw) - len(raw.lstrip(_WHITESPACE))
+                cut = seg.find(element)
+                seg_id = (seg if cut < 0 else seg[:cut]).decode("ascii", "replace")
+                yield Segment(seg_id, seg, offset, min(next_offset, size), delimiters)
+            offset = next_offset
+        pos = block_end
+
+
+def _loop_id(segment: Segment, current: str | None) -> str | None:
+    """Loop opened by segment, or None when it continues the current loop."""
+    seg_id = segment.seg_id
+    if seg_id in _HEADER_SEGMENTS:
+        return None if current == "HEADER" else "HEADER"
+    if seg_id in _TRAILER_SEGMENTS:
+        return None if current == "TRAILER" else "TRAILER"
+    if seg_id == "HL":
+        return _HL_LOOPS.get(segment.element(3), "2000")
+    if seg_id == "NM1" and current in (None, "HEADER", "1000A", "1000B"):
+        return _NM1_LOOPS.get(segment.element(1))
+    if seg_id == "CLM":
+        return "2300"
+    if seg_id == "SBR" and current in ("2300", "2320"):
+        return "2320"
+    if seg_id == "LX":
+        return "2400"
+    return None
+
+
+def iter_loops(segments: Iterator[Segment]) -> Iterator[Loop]:
+    """
+    Group segments into 837 loops (1000A, 1000B, 2000A/B/C, 2300, 2320, 2400; envelope segments
+    as HEADER/TRAILER). Only one loop is held in memory at a time.
+    """
+    current = None
+    pending = []
+    for segment in segments:
+        loop_id = _loop_id(segment, current)
+        if loop_id is not None and pending:
+            yield Loop(current, pending)
+            pending = []
+        if loop_id is not None:
+            current = loop_id
+        elif current is None:
+            current = "HEADER"
+        pending.append(segment)
+    if pending:
+        yield Loop(current, pending)
+
+
+class EdiFile:
+    """
+    A memory-mapped .edi file. segments()/loops() re-scan the mapping on each call; nothing
+    beyond the current segment or loop is kept in memory. Use as a context manager (or open_edi).
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        try:
+            size = self.path.stat().st_size
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+            self.delimiters = detect_delimiters(self._map[:ISA_LENGTH + 16])
+        except Exception:
+            self.close()
+            raise
+
+    def __len__(self) -> int:
+        return len(self._map)
+
+    def segments(self, start: int = 0) -> Iterator[Segment]:
+        return iter_segments(self._map, self.delimiters, start)
+
+    def loops(self, start: int = 0) -> Iterator[Loop]:
+        return iter_loops(self.segments(start))
+
+    def close(self):
+        if isinstance(getattr(self, "_map", None), mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> "EdiFile":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@contextmanager
+def open_edi(path: str | Path) -> Iterator[EdiFile]:
+    """Memory-map path for reading: with open_edi(p) as edi: for seg in edi.segments(): ..."""
+    edi = EdiFile(path)
+    try:
+        yield edi
+    finally:
+        edi.close()
+
+
+def parse_edi(edi: str | bytes) -> list[Segment]:
+    """All segments of an in-memory interchange (e.g. generator or OpenAI output)."""
+    data = edi.encode("utf-8") if isinstance(edi, str) else edi
+    return list(iter_segments(data))
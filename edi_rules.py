@@ -0,0 +1,452 @@
+"""
+Validation records and the segment rule engine (SNIP levels 3-4): claim balancing, HL
+hierarchy and date checks on the segments as they are built. Rules are registered against
+segment IDs and RuleEngine.check evaluates all of them while the segments stream past, so a
+batch is walked once however many rules there are; balancing rules keep running totals per
+claim. With an active StageTimer (edi_timing) each rule's time is recorded.
+"""
+import functools
+import itertools
+import os
+import re
+import time
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from typing import Iterable, Iterator, NamedTuple
+
+from .edi_timing import active_timer
+
+# EDI_RULES=0 turns the rule engine off (required-element checks still run).
+RULES_ENABLED = os.getenv("EDI_RULES", "1").lower() in ("1", "true", "yes")
+
+# Rule codes of ValidationIssue records, and the message template of each.
+RULE_REQUIRED_ELEMENT = "required_element"
+RULE_REQUIRED_LOOP = "required_loop"
+RULE_CLAIM_BALANCE = "claim_balance"
+RULE_AMOUNT = "amount_format"
+RULE_HL_STRUCTURE = "hl_structure"
+RULE_DATE = "date_format"
+_RULE_MESSAGES = {
+    RULE_REQUIRED_ELEMENT: "Loop {loop}: Required {element_id} ({label}) is missing.",
+    RULE_REQUIRED_LOOP: "Loop {loop} is required.",
+    RULE_CLAIM_BALANCE: "Loop {loop}: {element_id} does not equal the sum of the service line charges.",
+    RULE_AMOUNT: "Loop {loop}: {element_id} is not a valid amount.",
+    RULE_HL_STRUCTURE: "Loop {loop}: {element_id} breaks the HL hierarchy.",
+    RULE_DATE: "Loop {loop}: {element_id} is not a valid date.",
+}
+
+
+class ValidationIssue(NamedTuple):
+    """
+    One validation finding. claim_index is the claim's position in a batch (None for a single
+    claim), repetition the item of a repeatable loop (None otherwise), element_id "" for rules
+    about a whole loop; transaction_set is the ST02 when the claim was built into one of several
+    sets. The message is only rendered on demand (str(issue) or issue.message), so filtering
+    and counting issues never formats text.
+    """
+    claim_index: int | None
+    loop_id: str
+    element_id: str
+    repetition: int | None
+    rule: str = RULE_REQUIRED_ELEMENT
+    label: str = ""
+    transaction_set: str | None = None
+    detail: str = ""
+
+    @property
+    def message(self) -> str:
+        loop = self.loop_id if self.repetition is None else f"{self.loop_id}[{self.repetition}]"
+        text = _RULE_MESSAGES.get(self.rule, "Loop {loop}: {element_id} failed {rule}.").format(
+            loop=loop, element_id=self.element_id, label=self.label, rule=self.rule
+        )
+        if self.detail:
+            text = f"{text[:-1]}: {self.detail}." if text.endswith(".") else f"{text} {self.detail}"
+        if self.claim_index is not None:
+            text = f"Claim {self.claim_index}: {text}"
+        if self.transaction_set is not None:
+            text = f"ST {self.transaction_set} {text}"
+        return text
+
+    def __str__(self) -> str:
+        return self.message
+
+    def as_dict(self) -> dict:
+        """JSON-ready fields plus the rendered message."""
+        return {**self._asdict(), "message": self.message}
+
+
+def error_messages(errors: Iterable) -> list[str]:
+    """Render a list of ValidationIssue records (and plain error strings) as messages."""
+    return [str(e) for e in errors]
+
+
+# ─── Rule engine ──────────────────────────────────────────────────────────────
+
+# HL03 level -> (loop id, level of the parent HL; None for the top level).
+_HL_LEVELS = {"20": ("2000A", None), "22": ("2000B", "20"), "23": ("2000C", "22")}
+
+
+class PassState:
+    """
+    Position of one pass over a transaction set, kept by the engine and read by the rules:
+    the current loop, the 2400 repetition and the claim index (None outside batches).
+    """
+
+    __slots__ = ("errors", "batch", "claim", "loop_id", "repetition", "hl_level", "seen", "segment_ids")
+
+    def __init__(self, errors: list, batch: bool, segment_ids: dict | None = None):
+        self.errors = errors
+        self.batch = batch
+        self.claim = -1
+        self.loop_id = ""
+        self.repetition = None
+        self.hl_level = None
+        # Checked segments seen so far in the current loop, by segment ID.
+        self.seen = {}
+        # {loop_id: {seg_id: (element ids of each schema segment with that ID, in order)}}
+        self.segment_ids = segment_ids or {}
+
+    def element_id(self, seg_id: str, position: int) -> str:
+        """
+        Schema id of the element at position of the current seg_id segment, e.g. DTP03_2 for
+        the value of the second DTP in a loop that defines two (seg_id + position if unknown).
+        The nth such segment of a loop is taken to be its nth definition, so a segment left out
+        entirely (every element empty) shifts the ones after it.
+        """
+        definitions = self.segment_ids.get(self.loop_id, {}).get(seg_id, ())
+        occurrence = self.seen.get(seg_id, 1) - 1
+        if occurrence < len(definitions) and position <= len(definitions[occurrence]):
+            return definitions[occurrence][position - 1]
+        return f"{seg_id}{position:02d}"
+
+    def report(self, rule: str, element_id: str, detail: str = "", loop_id: str | None = None, repetition=-1):
+        """Append a ValidationIssue at the current position (loop_id / repetition override it)."""
+        self.errors.append(ValidationIssue(
+            self.claim if self.batch else None,
+            self.loop_id if loop_id is None else loop_id,
+            element_id,
+            self.repetition if repetition == -1 else repetition,
+            rule,
+            detail=detail,
+        ))
+
+
+class Rule:
+    """
+    A check run on the segments listed in seg_ids. The engine creates one instance per pass,
+    so instance attributes are that pass's running state. segment() gets the segment's
+    elements (elements[0] is the segment ID); end_claim() runs after the last segment of
+    each claim.
+    """
+
+    name = ""
+    seg_ids: tuple[str, ...] = ()
+
+    def segment(self, state: PassState, elements: list[str]):
+        pass
+
+    def end_claim(self, state: PassState):
+        pass
+
+
+def _element(elements: list[str], position: int) -> str:
+    return elements[position] if position < len(elements) else ""
+
+
+_ZERO = Decimal(0)
+
+
+class ClaimBalanceRule(Rule):
+    """CLM02 must equal the sum of the line charges (SV103 on 837P, SV202 on 837I)."""
+
+    name = RULE_CLAIM_BALANCE
+    seg_ids = ("CLM", "SV1", "SV2")
+    # Segment ID -> (position, element id) of the charge amount.
+    CHARGES = {"CLM": (2, "CLM02"), "SV1": (3, "SV103"), "SV2": (2, "SV202")}
+
+    def __init__(self):
+        self.claim_charge = None
+        self.line_total = _ZERO
+        self.lines = 0
+
+    def segment(self, state: PassState, elements: list[str]):
+        position, element_id = self.CHARGES[elements[0]]
+        if position >= len(elements) or not elements[position]:
+            return
+        text = elements[position]
+        try:
+            amount = Decimal(text)
+        except InvalidOperation:
+            amount = None
+        if amount is None or not amount.is_finite():
+            state.report(RULE_AMOUNT, element_id, repr(text))
+            return
+        if elements[0] == "CLM":
+            self.end_claim(state)
+            self.claim_charge = amount
+        else:
+            self.line_total += amount
+            self.lines += 1
+
+    def end_claim(self, state: PassState):
+        if self.claim_charge is not None and self.lines and self.claim_charge != self.line_total:
+            state.report(
+                RULE_CLAIM_BALANCE, "CLM02",
+                f"CLM02 is {self.claim_charge}, {self.lines} service line(s) total {self.line_total}",
+                loop_id="2300", repetition=None,
+            )
+        self.claim_charge = None
+        self.line_total = _ZERO
+        self.lines = 0
+
+
+class HierarchyRule(Rule):
+    """
+    HL IDs (HL02) run 1, 2, 3... within the transaction set, and each parent link (HL01)
+    names an earlier HL of the level above: 22 under 20, 23 under 22; 20 has no parent.
+    """
+
+    name = RULE_HL_STRUCTURE
+    seg_ids = ("HL",)
+
+    def __init__(self):
+        self.levels = {}
+
+    def segment(self, state: PassState, elements: list[str]):
+        if len(elements) < 4:
+            elements = elements + [""] * (4 - len(elements))
+        parent, hl_id, level = elements[1], elements[2], elements[3]
+        expected_id = str(len(self.levels) + 1)
+        if hl_id in self.levels:
+            state.report(RULE_HL_STRUCTURE, "HL02", f"ID {hl_id} is already used")
+        elif hl_id != expected_id:
+            state.report(RULE_HL_STRUCTURE, "HL02", f"ID {hl_id or '(empty)'} where {expected_id} was expected")
+        if level in _HL_LEVELS:
+            parent_level = _HL_LEVELS[level][1]
+            if parent_level is None:
+                if parent not in ("", "0"):
+                    state.report(RULE_HL_STRUCTURE, "HL01", f"level {level} has parent {parent}")
+            elif parent not in self.levels:
+                state.report(RULE_HL_STRUCTURE, "HL01", f"parent {parent or '(empty)'} is not an earlier HL ID")
+            elif self.levels[parent] != parent_level:
+                state.report(
+                    RULE_HL_STRUCTURE, "HL01",
+                    f"parent {parent} is level {self.levels[parent]}, expected {parent_level}",
+                )
+        self.levels.setdefault(hl_id, level)
+
+
+@functools.lru_cache(maxsize=4096)
+def _d8(text: str) -> date | None:
+    """CCYYMMDD as a date, or None when it is not a calendar date (cached: batches repeat dates)."""
+    if len(text) != 8 or not text.isdigit():
+        return None
+    try:
+        return date(int(text[:4]), int(text[4:6]), int(text[6:]))
+    except ValueError:
+        return None
+
+
+class DateRule(Rule):
+    """D8 dates (DTP03, DMG02) are calendar dates; RD8 ranges are two of them, in order."""
+
+    name = RULE_DATE
+    seg_ids = ("DTP", "DMG")
+    # Segment ID -> (position of the format qualifier, position of the value).
+    DATES = {"DTP": (2, 3), "DMG": (1, 2)}
+
+    def segment(self, state: PassState, elements: list[str]):
+        fmt_position, position = self.DATES[elements[0]]
+        if position >= len(elements) or not elements[position]:
+            return
+        fmt = elements[fmt_position]
+        text = elements[position]
+        if fmt == "D8":
+            if _d8(text) is None:
+                detail = f"{text!r} is not a CCYYMMDD date"
+            else:
+                return
+        elif fmt == "RD8":
+            start, _, end = text.partition("-")
+            start, end = _d8(start), _d8(end)
+            if start is None or end is None:
+                detail = f"{text!r} is not a CCYYMMDD-CCYYMMDD range"
+            elif start > end:
+                detail = f"range {text} ends before it starts"
+            else:
+                return
+        else:
+            return
+        state.report(RULE_DATE, state.element_id(elements[0], position), detail)
+
+
+def _timed(hook, name: str, timer):
+    """hook itself, or (with a StageTimer) a wrapper adding its time to the rule's total."""
+    if timer is None:
+        return hook
+
+    def timed(*args):
+        start = time.perf_counter()
+        hook(*args)
+        timer.add_rule(name, time.perf_counter() - start)
+
+    return timed
+
+
+DEFAULT_RULES = (ClaimBalanceRule, HierarchyRule, DateRule)
+
+
+class RuleEngine:
+    """
+    Rule classes indexed by segment ID. A pass (start(), or check() wrapping a segment
+    iterator) takes a transaction set's segments a chunk at a time; one compiled pattern picks
+    out of each chunk the segments some rule (or the engine's own loop tracking: HL, CLM, LX)
+    is registered for, and only those are decoded and split. The others are never looked at
+    in Python.
+    """
+
+    _TRACKED = ("HL", "CLM", "LX")
+    # Segments scanned per chunk (a single claim is one chunk).
+    CHUNK = 512
+
+    def __init__(self, rules: Iterable[type[Rule]] = DEFAULT_RULES):
+        self.rules = tuple(rules)
+        self._segment_ids = {}
+        self._index()
+
+    def _index(self):
+        self._by_seg_id = {seg_id: () for seg_id in self._TRACKED}
+        for index, rule in enumerate(self.rules):
+            for seg_id in rule.seg_ids:
+                self._by_seg_id[seg_id] = self._by_seg_id.get(seg_id, ()) + (index,)
+        # (encoding, element separator, terminator) -> pattern matching the checked segments
+        self._patterns = {}
+
+    def _pattern(self, encoding: str, element: str, terminator: str) -> re.Pattern:
+        """A terminator followed by a checked segment (group 1, its terminator excluded)."""
+        key = (encoding, element, terminator)
+        pattern = self._patterns.get(key)
+        if pattern is None:
+            seg_ids = b"|".join(
+                re.escape(seg_id.encode(encoding)) for seg_id in sorted(self._by_seg_id, key=len, reverse=True)
+            )
+            term = re.escape(terminator.encode(encoding))
+            pattern = self._patterns[key] = re.compile(
+                term + b"((?:" + seg_ids + b")" + re.escape(element.encode(encoding)) + b"[^" + term + b"]*)"
+            )
+        return pattern
+
+    def register(self, rule: type[Rule]) -> type[Rule]:
+        """Add a rule class (usable as a decorator); returns it."""
+        self.rules += (rule,)
+        self._index()
+        return rule
+
+    def start(self, errors: list, encoder, batch: bool = True, plan: tuple = ()) -> "RulePass":
+        """
+        A pass over one transaction set: feed its segments to scan() in order, in chunks of any
+        size, then call finish(). Issues are appended to errors as they are found (claim
+        balancing at the end of each claim). batch=True numbers claims from 0, as the builders
+        do; encoder gives the delimiters; plan (the compile_loops plan the segments were built
+        from) gives the element ids issues name.
+        """
+        return RulePass(self, errors, encoder, batch, plan)
+
+    def check(
+        self, segments: Iterable[bytes], errors: list, encoder, batch: bool = True, plan: tuple = ()
+    ) -> Iterator[bytes]:
+        """Yield segments unchanged while evaluating the rules on them (see start())."""
+        rule_pass = self.start(errors, encoder, batch, plan)
+        segments = iter(segments)
+        while chunk := list(itertools.islice(segments, self.CHUNK)):
+            rule_pass.scan(chunk)
+            yield from chunk
+        rule_pass.finish()
+
+    def _element_ids(self, plan: tuple) -> dict:
+        """PassState.segment_ids for plan (built once per plan)."""
+        cached = self._segment_ids.get(id(plan))
+        if cached is not None and cached[0] is plan:
+            return cached[1]
+        segment_ids = {}
+        for loop in plan:
+            by_seg_id = segment_ids.setdefault(loop.loop_id, {})
+            for seg in loop.segments:
+                by_seg_id[seg.seg_id] = by_seg_id.get(seg.seg_id, ()) + (seg.el_ids,)
+        self._segment_ids[id(plan)] = (plan, segment_ids)
+        return segment_ids
+
+
+class RulePass:
+    """One RuleEngine pass over a transaction set (see RuleEngine.start)."""
+
+    def __init__(self, engine: RuleEngine, errors: list, encoder, batch: bool, plan: tuple):
+        self._engine = engine
+        self._encoding = encoder.encoding
+        self._element = encoder.element
+        self._finditer = engine._pattern(encoder.encoding, encoder.element, encoder.terminator).finditer
+        # Prefixed to each chunk so its first segment follows a terminator too.
+        self._term = encoder.terminator.encode(encoder.encoding)
+        rules = [rule() for rule in engine.rules]
+        # Hooks of this pass's rule instances (wrapped only when a StageTimer is active).
+        timer = active_timer()
+        self._hooks = [_timed(rule.segment, rule.name, timer) for rule in rules]
+        self._end_claim = [_timed(rule.end_claim, rule.name, timer) for rule in rules]
+        self.state = PassState(errors, batch, engine._element_ids(plan))
+
+    def scan(self, segments: list[bytes]):
+        """Evaluate the rules on the next segments of the transaction set."""
+        by_seg_id = self._engine._by_seg_id
+        encoding = self._encoding
+        element = self._element
+        hooks = self._hooks
+        state = self.state
+        seen = state.seen
+        for match in self._finditer(self._term + b"".join(segments)):
+            elements = match.group(1).decode(encoding).split(element)
+            seg_id = elements[0]
+            # Follow the loop position (and 2400 repetition) the rules report against.
+            if seg_id == "HL":
+                level = _element(elements, 3)
+                # A billing provider HL starts a claim; so does a subscriber HL not right under one.
+                if level == "20" or (level == "22" and state.hl_level != "20"):
+                    if state.claim >= 0:
+                        for hook in self._end_claim:
+                            hook(state)
+                    state.claim += 1
+                state.hl_level = level
+                state.loop_id = _HL_LEVELS.get(level, ("2000",))[0]
+                state.repetition = None
+                seen.clear()
+            elif seg_id == "CLM":
+                state.loop_id = "2300"
+                state.repetition = None
+                seen.clear()
+            elif seg_id == "LX":
+                state.loop_id = "2400"
+                state.repetition = 0 if state.repetition is None else state.repetition + 1
+                seen.clear()
+            indexes = by_seg_id[seg_id]
+            if indexes:
+                seen[seg_id] = seen.get(seg_id, 0) + 1
+                for index in indexes:
+                    hooks[index](state, elements)
+
+    def finish(self):
+        """Run the end-of-claim checks of the last claim."""
+        for hook in self._end_claim:
+            hook(self.state)
+
+
+_engine = RuleEngine() if RULES_ENABLED else None
+
+
+def get_rule_engine() -> RuleEngine | None:
+    """The process-wide RuleEngine used by the builders, or None when EDI_RULES=0."""
+    return _engine
+
+
+def set_rule_engine(engine: RuleEngine | None):
+    """Replace the process-wide engine (None turns the rules off)."""
+    global _engine
+    _engine = engine
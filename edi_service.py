@@ -0,0 +1,392 @@
+"""
+Local HTTP generation service (stdlib asyncio, HTTP/1.1 keep-alive).
+POST /v1/claims/<837P|837I> with one claim's form_data as JSON. Requests arriving within
+batch_window of each other are coalesced into one micro-batch that a worker process builds in a
+single pass, so each request costs one slot in a batch rather than one pool round trip.
+Responses are the usual result dicts as JSON: ?output=edi (default) carries the EDI text in
+"edi" (or the raw EDI with Accept: application/edi-x12), ?output=file writes the file through
+the output sink and returns its file_path/file_name. "errors" holds the rendered messages and
+"validation" the structured issues (rule, loop_id, element_id, repetition, ...). GET /healthz reports status; GET /metrics
+serves the edi_metrics registry when metrics are enabled.
+
+  python -m EDI_File_Generator.edi_service --port 8837 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+from .edi_agent import generate_837_file
+from .edi_generator import ValidationIssue, build_edi_content, compile_loops
+from .edi_metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, enable_metrics, get_metrics
+from .edi_schemas import get_loops
+
+DEFAULT_HOST = os.getenv("EDI_SERVICE_HOST", "127.0.0.1")
+DEFAULT_PORT = int(os.getenv("EDI_SERVICE_PORT", 8837))
+# Coalescing window and cap of a micro-batch; requests beyond max_pending get 503.
+DEFAULT_BATCH_WINDOW = float(os.getenv("EDI_SERVICE_BATCH_MS", 2)) / 1000
+DEFAULT_MAX_BATCH = 64
+DEFAULT_MAX_PENDING = 10_000
+MAX_BODY = 1 << 20
+MAX_HEADER = 16 * 1024
+KEEPALIVE_TIMEOUT = 15.0
+OUTPUTS = ("edi", "file")
+EDI_CONTENT_TYPE = "application/edi-x12"
+
+
+class ServiceBusy(Exception):
+    """More claims are queued or in flight than the service accepts."""
+
+
+def _init_worker(metrics_enabled: bool):
+    """
+    Worker initializer. The environment (EDI_METRICS, EDI_METRICS_PORT, EDI_METRICS_FILE) is
+    inherited from the service, so without this a worker would start its own exporters on the
+    service's port and file. Record into a local registry instead; build_batch hands its
+    values back to the service.
+    """
+    if metrics_enabled:
+        enable_metrics(port=None, path=None)
+
+
+def _warm_up() -> int:
+    """Worker: import and compile the schemas before the first batch arrives."""
+    for claim_type in ("837P", "837I"):
+        compile_loops(get_loops(claim_type))
+    return os.getpid()
+
+
+def build_batch(claim_type: str, claims: list[dict], output: str) -> tuple[list[dict], dict | None]:
+    """
+    Worker: build every claim of a micro-batch in one pass (one interchange per claim, control
+    numbers from the shared allocator). A failing claim only fails its own result.
+    Returns (results, metrics recorded for the batch or None), the latter for the service's registry.
+    """
+    loops_schema = get_loops(claim_type)
+    metrics = get_metrics()
+    results = []
+    for form_data in claims:
+        if output == "file":
+            results.append(generate_837_file(claim_type, form_data))
+            continue
+        try:
+            edi, errors = build_edi_content(claim_type, form_data, loops_schema)
+        except Exception as e:
+            results.append({"success": False, "edi": None, "errors": [str(e)], "message": f"EDI could not be built: {e}"})
+            continue
+        if metrics is not None:
+            metrics.claims.inc(claim_type=claim_type, path="service")
+            metrics.record_validation_errors(claim_type, errors)
+        results.append({
+            "success": True,
+            "edi": edi,
+            "errors": errors,
+            "message": "EDI generated" + (f" ({len(errors)} validation warning(s))." if errors else "."),
+        })
+    return (results, metrics.take() if metrics is not None else None)
+
+
+class MicroBatcher:
+    """
+    Coalesces submit() calls per (claim_type, output): a batch is sent to the pool when it
+    reaches max_batch claims or window seconds after its first claim, whichever comes first.
+    Runs on one event loop.
+    """
+
+    def __init__(
+        self,
+        pool: Executor,
+        window: float = DEFAULT_BATCH_WINDOW,
+        max_batch: int = DEFAULT_MAX_BATCH,
+        max_pending: int = DEFAULT_MAX_PENDING,
+    ):
+        self.pool = pool
+        self.window = window
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.pending = 0
+        self._batches = {}
+
+    async def submit(self, claim_type: str, form_data: dict, output: str = "edi") -> dict:
+        if self.pending >= self.max_pending:
+            raise ServiceBusy(f"{self.pending} claims pending")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = (claim_type, output)
+        batch = self._batches.get(key)
+        if batch is None:
+            handle = loop.call_later(self.window, self._flush, key) if self.window > 0 else None
+            batch = self._batches[key] = ([], [], handle)
+        batch[0].append(form_data)
+        batch[1].append(future)
+        self.pending += 1
+        if self.window <= 0 or len(batch[0]) >= self.max_batch:
+            self._flush(key)
+        try:
+            return await future
+        finally:
+            self.pending -= 1
+
+    def _flush(self, key: tuple):
+        batch = self._batches.pop(key, None)
+        if batch is None:
+            return
+        claims, futures, handle = batch
+        if handle is not None:
+            handle.cancel()
+        metrics = get_metrics()
+        if metrics is not None:
+            metrics.service_batch_size.observe(len(claims))
+        task = asyncio.get_running_loop().run_in_executor(self.pool, build_batch, key[0], claims, key[1])
+        task.add_done_callback(lambda t: self._deliver(t, futures))
+
+    @staticmethod
+    def _deliver(task: asyncio.Future, futures: list):
+        if task.cancelled():
+            for future in futures:
+                future.cancel()
+            return
+        error = task.exception()
+        results = None
+        if error is None:
+            results, recorded = task.result()
+            metrics = get_metrics()
+            if recorded and metrics is not None:
+                metrics.merge(recorded)
+        for n, future in enumerate(futures):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(results[n])
+
+
+def _malformed_loop(claim_type: str, form_data: dict) -> str | None:
+    """
+    Why form_data does not have the shape the builders read, or None: each loop a dict (a
+    repeatable loop may be a list of dicts), _ISA/ISA/_BHT dicts.
+    """
+    for key in ("_ISA", "ISA", "_BHT"):
+        if form_data.get(key) is not None and not isinstance(form_data[key], dict):
+            return f"{key} must be an object, not {type(form_data[key]).__name__}."
+    for loop_def in get_loops(claim_type):
+        loop_id = loop_def["loop_id"]
+        value = form_data.get(loop_id)
+        if value is None or isinstance(value, dict):
+            continue
+        if not isinstance(value, list) or not loop_def.get("repeatable"):
+            expected = "an object or a list of objects" if loop_def.get("repeatable") else "an object"
+            return f"Loop {loop_id} must be {expected}, not {type(value).__name__}."
+        for n, item in enumerate(value):
+            if not isinstance(item, dict):
+                return f"Loop {loop_id} item {n} must be an object, not {type(item).__name__}."
+    return None
+
+
+class _BadRequest(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _json_response(status: HTTPStatus, payload: dict) -> tuple:
+    return status, "application/json", json.dumps(payload).encode("utf-8")
+
+
+def _error_response(status: HTTPStatus, message: str) -> tuple:
+    return _json_response(status, {
+        "success": False, "file_path": None, "file_name": None, "errors": [message], "message": message,
+    })
+
+
+class GenerationService:
+    """The HTTP front end: parses requests, hands claims to the MicroBatcher, writes responses."""
+
+    def __init__(self, batcher: MicroBatcher, workers: int = 0):
+        self.batcher = batcher
+        self.workers = workers
+        self.started = time.time()
+        self.requests = 0
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEPALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    writer.write(self._encode(*_error_response(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE,
+                                                               "Request header too large."), False))
+                    break
+                try:
+                    method, target, version, headers = self._parse_head(head)
+                    connection = headers.get("connection", "").lower()
+                    keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+                    body = await self._read_body(reader, headers)
+                    response = await self.dispatch(method, target, headers, body)
+                except _BadRequest as e:
+                    # The rest of the request may be unread: answer and close.
+                    response = _error_response(e.status, str(e))
+                    keep_alive = False
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                writer.write(self._encode(*response, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _parse_head(head: bytes) -> tuple:
+        try:
+            lines = head.decode("latin-1").split("\r\n")
+            method, target, version = lines[0].split(" ", 2)
+        except ValueError:
+            raise _BadRequest(HTTPStatus.BAD_REQUEST, "Malformed request line.") from None
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(":")
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+        return method.upper(), target, version, headers
+
+    @staticmethod
+    async def _read_body(reader: asyncio.StreamReader, headers: dict) -> bytes:
+        if "transfer-encoding" in headers:
+            raise _BadRequest(HTTPStatus.LENGTH_REQUIRED, "Chunked bodies are not supported; send Content-Length.")
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise _BadRequest(HTTPStatus.BAD_REQUEST, "Invalid Content-Length.") from None
+        if length > MAX_BODY:
+            raise _BadRequest(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Body larger than {MAX_BODY} bytes.")
+        return await reader.readexactly(length) if length else b""
+
+    @staticmethod
+    def _encode(status: HTTPStatus, content_type: str, body: bytes, keep_alive: bool) -> bytes:
+        head = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        return head.encode("latin-1") + body
+
+    async def dispatch(self, method: str, target: str, headers: dict, body: bytes) -> tuple:
+        """(status, content_type, body) for one request."""
+        url = urlsplit(target)
+        path = url.path.rstrip("/")
+        if path == "/healthz" and method == "GET":
+            return _json_response(HTTPStatus.OK, {
+                "status": "ok",
+                "workers": self.workers,
+                "pending": self.batcher.pending,
+                "requests": self.requests,
+                "uptime": time.time() - self.started,
+            })
+        if path == "/metrics" and method == "GET":
+            metrics = get_metrics()
+            if metrics is None:
+                return _error_response(HTTPStatus.NOT_FOUND, "Metrics are disabled (set EDI_METRICS=1).")
+            return HTTPStatus.OK, METRICS_CONTENT_TYPE, metrics.render().encode("utf-8")
+        if not path.startswith("/v1/claims/"):
+            return _error_response(HTTPStatus.NOT_FOUND, f"No such endpoint: {url.path}")
+        if method != "POST":
+            return _error_response(HTTPStatus.METHOD_NOT_ALLOWED, "Use POST.")
+
+        claim_type = path.rsplit("/", 1)[1].upper()
+        if claim_type not in ("837P", "837I"):
+            return _error_response(HTTPStatus.NOT_FOUND, f"Invalid claim type: {claim_type}. Use 837P or 837I.")
+        output = parse_qs(url.query).get("output", ["edi"])[0]
+        if output not in OUTPUTS:
+            return _error_response(HTTPStatus.BAD_REQUEST, f"Invalid output: {output}. Use one of {', '.join(OUTPUTS)}.")
+        try:
+            form_data = json.loads(body)
+        except ValueError as e:
+            return _error_response(HTTPStatus.BAD_REQUEST, f"Invalid JSON: {e}")
+        if not isinstance(form_data, dict):
+            return _error_response(HTTPStatus.BAD_REQUEST, "Body must be one claim's form_data object.")
+        malformed = _malformed_loop(claim_type, form_data)
+        if malformed is not None:
+            return _error_response(HTTPStatus.BAD_REQUEST, malformed)
+
+        self.requests += 1
+        start = time.perf_counter()
+        try:
+            result = await self.batcher.submit(claim_type, form_data, output)
+        except ServiceBusy as e:
+            return _error_response(HTTPStatus.SERVICE_UNAVAILABLE, f"Service busy: {e}")
+        except Exception as e:
+            return _error_response(HTTPStatus.INTERNAL_SERVER_ERROR, f"Generation failed: {e}")
+        finally:
+            metrics = get_metrics()
+            if metrics is not None:
+                metrics.service_seconds.observe(time.perf_counter() - start, claim_type=claim_type, output=output)
+
+        status = HTTPStatus.OK if result["success"] else HTTPStatus.UNPROCESSABLE_ENTITY
+        if output == "edi" and result["success"] and EDI_CONTENT_TYPE in headers.get("accept", ""):
+            return status, EDI_CONTENT_TYPE, result["edi"].encode("utf-8")
+        errors = result["errors"]
+        result["validation"] = [e.as_dict() for e in errors if isinstance(e, ValidationIssue)]
+        result["errors"] = [str(e) for e in errors]
+        return _json_response(status, result)
+
+
+async def serve(
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    workers: int | None = None,
+    window: float = DEFAULT_BATCH_WINDOW,
+    max_batch: int = DEFAULT_MAX_BATCH,
+    ready: asyncio.Event | None = None,
+):
+    """Run the service until cancelled; workers processes (EDI_SERVICE_WORKERS / CPU count) build the EDI."""
+    workers = workers or int(os.getenv("EDI_SERVICE_WORKERS", 0)) or os.cpu_count() or 1
+    loop = asyncio.get_running_loop()
+    # Stop cleanly on SIGTERM too, so the worker processes are shut down with the service.
+    if hasattr(signal, "SIGTERM"):
+        try:
+            loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        except (NotImplementedError, RuntimeError):
+            pass
+    pool = ProcessPoolExecutor(
+        workers, mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker, initargs=(get_metrics() is not None,),
+    )
+    with pool:
+        await asyncio.gather(*(loop.run_in_executor(pool, _warm_up) for _ in range(workers)))
+        service = GenerationService(MicroBatcher(pool, window, max_batch), workers)
+        server = await asyncio.start_server(service.handle_connection, host, port, limit=MAX_HEADER, backlog=1024)
+        async with server:
+            print(f"EDI service on http://{host}:{port} ({workers} workers, batch window {window * 1000:g} ms)", flush=True)
+            if ready is not None:
+                ready.set()
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local HTTP service generating 837P/837I EDI.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: EDI_SERVICE_WORKERS or CPU count)")
+    parser.add_argument("--batch-ms", type=float, default=DEFAULT_BATCH_WINDOW * 1000,
+                        help="Coalescing window in milliseconds (0 sends every request on its own)")
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.batch_ms / 1000, args.max_batch))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Output sinks for generated EDI files.
+FileSink writes each file under a hidden temporary name and renames it into place when it is
+complete, so pickup jobs never see a partial file; names carry a unique token (the ISA13 control
+number, or a per-process sequence) and existing files are never overwritten. Files go to
+date-sharded subdirectories, and fsync can be per file, grouped, or skipped.
+"""
+import atexit
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+# always: fsync each file and its directory before the rename is reported.
+# group: rename at once, fsync every group_size files / group_interval seconds (and at exit).
+# never: leave flushing to the OS.
+FSYNC_POLICIES = ("always", "group", "never")
+
+DEFAULT_OUTPUT_DIR = Path(os.getenv("EDI_OUTPUT_DIR") or Path(__file__).parent / "edi_output")
+# strftime pattern for the subdirectory of each file ("" for a flat directory).
+DEFAULT_SHARD = os.getenv("EDI_OUTPUT_SHARD", "%Y/%m/%d")
+DEFAULT_FSYNC = os.getenv("EDI_OUTPUT_FSYNC", "always")
+
+
+class OutputFile:
+    """A file being written through a sink: write to fp; path is final once the block exits."""
+
+    __slots__ = ("fp", "path")
+
+    def __init__(self, fp: BinaryIO, path: Path):
+        self.fp = fp
+        self.path = path
+
+    @property
+    def name(self) -> str:
+        return self.path.name
+
+
+def _fsync_path(path: Path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    except OSError:
+        # Directories cannot be fsynced on some platforms (e.g. Windows).
+        pass
+    finally:
+        os.close(fd)
+
+
+class FileSink:
+    """
+    Atomic, collision-free .edi writer rooted at root. Subclass (or implement open/flush) to send
+    output elsewhere, and install it with set_output_sink.
+    """
+
+    def __init__(
+        self,
+        root: str | Path = DEFAULT_OUTPUT_DIR,
+        shard: str = DEFAULT_SHARD,
+        fsync: str = DEFAULT_FSYNC,
+        group_size: int = 64,
+        group_interval: float = 1.0,
+    ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Invalid fsync policy: {fsync}. Use one of {', '.join(FSYNC_POLICIES)}.")
+        self.root = Path(root)
+        self.shard = shard
+        self.fsync = fsync
+        self.group_size = group_size
+        self.group_interval = group_interval
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+        self._pending = []
+        self._last_sync = time.monotonic()
+        if fsync == "group":
+            atexit.register(self.flush)
+
+    def new_path(self, claim_type: str, token: str | None = None) -> Path:
+        """Path for a new file: <root>/<shard>/<claim_type>_<YYYYMMDD_HHMMSS>_<token>.edi (parent created)."""
+        now = datetime.now()
+        directory = self.root / now.strftime(self.shard) if self.shard else self.root
+        directory.mkdir(parents=True, exist_ok=True)
+        token = token or f"{os.getpid()}-{next(self._seq)}"
+        return directory / f"{claim_type}_{now.strftime('%Y%m%d_%H%M%S')}_{token}.edi"
+
+    @contextmanager
+    def open(self, claim_type: str, token: str | None = None) -> Iterator[OutputFile]:
+        """
+        Yield an OutputFile backed by a hidden temporary file; on normal exit it is renamed to a
+        name no other file has (a "-n" suffix is added on collision), on error it is deleted.
+        """
+        path = self.new_path(claim_type, token)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        fp = open(tmp_path, "wb")
+        out = OutputFile(fp, path)
+        try:
+            yield out
+            fp.flush()
+            if self.fsync == "always":
+                os.fsync(fp.fileno())
+            fp.close()
+            out.path = self._commit(tmp_path, path)
+        except BaseException:
+            fp.close()
+            tmp_path.unlink(missing_ok=True)
+            raise
+        self._after_commit(out.path)
+
+    def write(self, claim_type: str, data: bytes, token: str | None = None) -> Path:
+        """Write data as one file; returns its final path."""
+        with self.open(claim_type, token) as out:
+            out.fp.write(data)
+        return out.path
+
+    def publish(self, tmp_path: Path, path: Path) -> Path:
+        """
+        Commit a complete file written under a hidden name of its own (e.g. an open interchange)
+        as path, the way open() commits its files; returns the final path.
+        """
+        if self.fsync == "always":
+            _fsync_path(tmp_path)
+        path = self._commit(tmp_path, path)
+        self._after_commit(path)
+        return path
+
+    def _commit(self, tmp_path: Path, path: Path) -> Path:
+        """Move tmp_path to path (or path-1, path-2, ... if taken) without replacing anything."""
+        for attempt in itertools.count():
+            target = path if attempt == 0 else path.with_name(f"{path.stem}-{attempt}{path.suffix}")
+            try:
+                os.link(tmp_path, target)
+            except FileExistsError:
+                continue
+            except OSError:
+                # No hard links on this filesystem: fall back to a checked rename.
+                if target.exists():
+                    continue
+                os.replace(tmp_path, target)
+                return target
+            os.unlink(tmp_path)
+            return target
+
+    def _after_commit(self, path: Path):
+        if self.fsync == "always":
+            _fsync_path(path.parent)
+        elif self.fsync == "group":
+            with self._lock:
+                self._pending.append(path)
+                due = (len(self._pending) >= self.group_size
+                       or time.monotonic() - self._last_sync >= self.group_interval)
+            if due:
+                self.flush()
+
+    def flush(self):
+        """fsync files (and their directories) committed since the last group sync."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._last_sync = time.monotonic()
+        for path in pending:
+            try:
+                _fsync_path(path)
+            except FileNotFoundError:
+                pass
+        for directory in {p.parent for p in pending}:
+            _fsync_path(directory)
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_output_sink() -> FileSink:
+    """Process-wide sink (EDI_OUTPUT_DIR, EDI_OUTPUT_SHARD and EDI_OUTPUT_FSYNC configure the default)."""
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            _sink = FileSink()
+        return _sink
+
+
+def set_output_sink(sink: FileSink) -> FileSink:
+    """Replace the process-wide sink; returns the old one."""
+    global _sink
+    with _sink_lock:
+        previous, _sink = _sink, sink
+        return previous
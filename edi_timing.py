@@ -0,0 +1,141 @@
+"""
+Opt-in instrumentation: per-stage (and per-loop) monotonic timings for a generation call, and
+a switch to run a call or batch under cProfile or tracemalloc with the stats dumped to a file.
+The active StageTimer is held in a context variable, so the generator code only looks it up
+once per claim and does nothing extra when timing is off.
+"""
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+# EDI_TIMINGS=1 turns timings on for calls that do not say otherwise.
+TIMINGS_DEFAULT = os.getenv("EDI_TIMINGS", "0").lower() in ("1", "true", "yes")
+PROFILERS = ("cprofile", "tracemalloc")
+
+_active = contextvars.ContextVar("edi_stage_timer", default=None)
+
+
+class StageTimer:
+    """Accumulates seconds per stage, loop and validation rule; as_dict() is what goes into result dicts."""
+
+    def __init__(self):
+        self.stages = {}
+        self.loops = {}
+        self.rules = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_loop(self, loop_id: str, seconds: float):
+        self.loops[loop_id] = self.loops.get(loop_id, 0.0) + seconds
+
+    def add_rule(self, rule: str, seconds: float):
+        """Time spent in one edi_rules rule; also counted in the "rules" stage."""
+        self.rules[rule] = self.rules.get(rule, 0.0) + seconds
+        self.stages["rules"] = self.stages.get("rules", 0.0) + seconds
+
+    def as_dict(self) -> dict:
+        """
+        {"total", "stages": {name: seconds}, "loops": {loop_id: seconds}, "rules": {rule: seconds}}
+        (seconds, monotonic clock).
+        """
+        return {
+            "total": time.perf_counter() - self._start,
+            "stages": dict(self.stages),
+            "loops": dict(self.loops),
+            "rules": dict(self.rules),
+        }
+
+
+def active_timer() -> StageTimer | None:
+    """The StageTimer of the current call, or None when timing is off."""
+    return _active.get()
+
+
+@contextmanager
+def timing(enabled: bool | None = None) -> Iterator[StageTimer | None]:
+    """
+    Activate a StageTimer for the enclosed code (enabled=None follows EDI_TIMINGS); yields it,
+    or None when disabled. A timer that is already active is reused, so nested calls add to it.
+    """
+    if enabled is None:
+        enabled = TIMINGS_DEFAULT
+    current = _active.get()
+    if not enabled or current is not None:
+        yield current if enabled else None
+        return
+    timer = StageTimer()
+    token = _active.set(timer)
+    try:
+        yield timer
+    finally:
+        _active.reset(token)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the enclosed code as stage name when a timer is active."""
+    timer = _active.get()
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+@contextmanager
+def profiled(kind: str, path: str | Path, limit: int = 50) -> Iterator[None]:
+    """
+    Run the enclosed call or batch under a profiler and write its stats to path:
+    cprofile: pstats dump (open with pstats / snakeviz); a "<path>.txt" summary sorted by
+    cumulative time is written next to it. tracemalloc: top allocation sites by line, plus
+    the peak traced memory.
+    """
+    if kind not in PROFILERS:
+        raise ValueError(f"Unknown profiler: {kind}. Use one of {', '.join(PROFILERS)}.")
+    # Imported here: the profilers cost more to import than the rest of the package.
+    import cProfile
+    import pstats
+    import tracemalloc
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if kind == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+            with open(path.with_name(path.name + ".txt"), "w", encoding="utf-8") as f:
+                pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(limit)
+        return
+
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        yield
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if not already_tracing:
+            tracemalloc.stop()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"Peak traced memory: {peak / 1024:.1f} KiB\n")
+            for stat in snapshot.statistics("lineno")[:limit]:
+                f.write(f"{stat}\n")
@@ -5,8 +5,25 @@ Usage (from project root Gen-AI-Dev-Course):
   python EDI_File_Generator/run_edi_generator.py
   python EDI_File_Generator/run_edi_generator.py 837P
   python EDI_File_Generator/run_edi_generator.py 837I
+  python EDI_File_Generator/run_edi_generator.py 837P --bulk claims.jsonl --workers 8 --chunk-size 1000
+  python EDI_File_Generator/run_edi_generator.py 837P --bulk claims_dir/
+  python EDI_File_Generator/run_edi_generator.py 837P --bulk claims.jsonl --chunk-size 5000 --max-bytes 50000000
+  python EDI_File_Generator/run_edi_generator.py 837P --timings
+  python EDI_File_Generator/run_edi_generator.py 837P --bulk claims.jsonl --profile cprofile --profile-out prof/bulk.pstats
+
+Bulk mode reads form_data records from a JSONL file (one claim per line) or a directory of
+*.json files, builds one transaction set per chunk across a process pool, and writes the
+transaction sets in input order to edi_output/ (via the output sink), in one interchange or,
+with --max-sts-per-gs / --max-bytes, as many groups and files as the limits require.
+
+--timings prints the per-stage breakdown of a single-file run; --profile runs either mode under
+cProfile or tracemalloc and writes the stats to --profile-out (see edi_timing.profiled).
 """
+import argparse
+import json
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 # Add project root so EDI_File_Generator can be imported when run from anywhere
@@ -15,6 +32,9 @@ if str(_project_root) not in sys.path:
     sys.path.insert(0, str(_project_root))
 
 from EDI_File_Generator import generate_837_file
+from EDI_File_Generator.edi_agent import RolloverLimits
+from EDI_File_Generator.edi_bulk import generate_bulk
+from EDI_File_Generator.edi_timing import PROFILERS, profiled
 
 
 def sample_837p_data():
@@ -66,17 +86,86 @@ def sample_837i_data():
     return data
 
 
+def _load_claims(source: Path):
+    """Yield form_data dicts from a JSONL file or a directory of *.json files."""
+    if source.is_dir():
+        for path in sorted(source.glob("*.json")):
+            yield json.loads(path.read_text(encoding="utf-8"))
+    else:
+        with open(source, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def run_bulk(claim_type: str, source: Path, workers: int, limits: RolloverLimits) -> dict:
+    """
+    Build interchanges from all claims in source using a process pool (see edi_bulk.generate_bulk).
+    Returns a summary dict (files, claims, transaction_sets, seconds, errors, per_worker).
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return generate_bulk(claim_type, _load_claims(source), pool, limits, window=workers * 2)
+
+
+def main_bulk(claim_type: str, args) -> None:
+    workers = args.workers or os.cpu_count() or 1
+    limits = RolloverLimits(args.chunk_size, args.max_sts_per_gs, args.max_bytes)
+    print(f"Generating {claim_type} EDI file from {args.bulk} ({workers} workers, chunk size {args.chunk_size})...")
+    summary = run_bulk(claim_type, Path(args.bulk), workers, limits)
+    seconds = summary["seconds"]
+    print(f"Success: {summary['claims']} claims in {summary['transaction_sets']} transaction set(s), "
+          f"{len(summary['files'])} file(s), {seconds:.2f}s ({summary['claims'] / seconds:.0f} claims/sec)")
+    for file_path in summary["files"]:
+        print("File:", file_path)
+    for pid, stats in sorted(summary["per_worker"].items()):
+        rate = stats["claims"] / stats["seconds"] if stats["seconds"] else 0.0
+        print(f"  Worker {pid}: {stats['claims']} claims, {rate:.0f} claims/sec")
+    if summary["errors"]:
+        print(f"  {len(summary['errors'])} validation warning(s); first: {summary['errors'][0]}")
+
+
 def main():
-    claim_type = "837P"
-    if len(sys.argv) > 1:
-        claim_type = sys.argv[1].upper()
-        if claim_type not in ("837P", "837I"):
-            print("Usage: python run_edi_generator.py [837P|837I]")
-            sys.exit(1)
+    parser = argparse.ArgumentParser(description="Generate 837P/837I EDI files.")
+    parser.add_argument("claim_type", nargs="?", default="837P", type=str.upper, choices=("837P", "837I"))
+    parser.add_argument("--bulk", metavar="PATH", help="JSONL file or directory of .json form_data records")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Claims per worker task / transaction set")
+    parser.add_argument("--max-sts-per-gs", type=int, default=None, help="Start a new GS group after this many transaction sets")
+    parser.add_argument("--max-bytes", type=int, default=None, help="Start a new file before exceeding this size")
+    parser.add_argument("--timings", action="store_true", help="Print per-stage, per-loop and per-rule timings (single file)")
+    parser.add_argument("--profile", choices=PROFILERS, default=None, help="Run under a profiler")
+    parser.add_argument("--profile-out", metavar="PATH", default=None,
+                        help="Profiler output (default: edi_<profiler>.out in the current directory)")
+    args = parser.parse_args()
+
+    if args.profile:
+        profile_out = args.profile_out or f"edi_{args.profile}.out"
+        with profiled(args.profile, profile_out):
+            run(args)
+        print(f"Profile ({args.profile}) written to {profile_out}")
+    else:
+        run(args)
+
+
+def _print_timings(timings: dict) -> None:
+    print(f"Timings: {timings['total'] * 1000:.3f} ms total")
+    for name, seconds in timings["stages"].items():
+        print(f"  {name:<16} {seconds * 1000:9.3f} ms")
+    for loop_id, seconds in timings["loops"].items():
+        print(f"  loop {loop_id:<11} {seconds * 1000:9.3f} ms")
+    for rule, seconds in timings.get("rules", {}).items():
+        print(f"  rule {rule:<11} {seconds * 1000:9.3f} ms")
+
+
+def run(args) -> None:
+    claim_type = args.claim_type
+    if args.bulk:
+        main_bulk(claim_type, args)
+        return
 
     form_data = sample_837i_data() if claim_type == "837I" else sample_837p_data()
     print(f"Generating {claim_type} EDI file...")
-    result = generate_837_file(claim_type, form_data)
+    result = generate_837_file(claim_type, form_data, timings=args.timings or None)
 
     if result["success"]:
         print("Success:", result["message"])
@@ -84,6 +173,8 @@ def main():
         if result.get("errors"):
             for e in result["errors"]:
                 print("  Warning:", e)
+        if result.get("timings"):
+            _print_timings(result["timings"])
     else:
         print("Error:", result["message"])
         for e in result.get("errors", []):